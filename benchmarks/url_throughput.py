@@ -0,0 +1,150 @@
+"""Throughput of url-decode and url-encode, against the text block implementations"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import random
+import sys
+import time
+import urllib.parse
+from collections.abc import Callable
+from io import BytesIO, StringIO
+
+from elastic.thrunting_tools.format import url_decode, url_encode
+
+# The block size and approach used before decoding bytes, for comparison
+BASELINE_BLOCK_SIZE: int = 4096
+PATHS = ("/search", "/login.php", "/wp-admin/admin-ajax.php", "/api/v1/items")
+VALUES = (
+    "admin",
+    "' OR 1=1 --",
+    "../../etc/passwd",
+    "<script>alert(1)</script>",
+    "ünïcödé ✓",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+)
+
+
+def proxy_log(size_mb: int) -> bytes:
+    """Fakes a proxy log: one request per line, with URL encoded query strings"""
+    _random = random.Random(0)
+    _lines = []
+    _size: int = 0
+    while _size < size_mb * 1024 * 1024:
+        _query = urllib.parse.urlencode(
+            {
+                f"p{_idx}": _random.choice(VALUES)
+                for _idx in range(_random.randint(1, 4))
+            }
+        )
+        _line = (
+            f"2022-11-01T00:00:{_size % 60:02}Z 10.0.0.{_size % 256} GET "
+            f"http://example.com{_random.choice(PATHS)}?{_query} 200\n"
+        ).encode("utf-8")
+        _lines.append(_line)
+        _size += len(_line)
+    return b"".join(_lines)
+
+
+def baseline(data: bytes) -> None:
+    """Decodes text blocks separately, like url-decode did before"""
+    _stream = StringIO(data.decode("utf-8"))
+    while _block := _stream.read(BASELINE_BLOCK_SIZE):
+        urllib.parse.unquote(_block)
+
+
+def baseline_encode(data: bytes) -> None:
+    """Encodes text blocks with quote and four more passes, like url-encode --all did"""
+    _stream = StringIO(data.decode("utf-8"))
+    while _block := _stream.read(BASELINE_BLOCK_SIZE):
+        _quoted = urllib.parse.quote(_block, safe="")
+        for _char in "_.-~":
+            _quoted = _quoted.replace(_char, f"%{ord(_char):02X}")
+
+
+def encode(data: bytes) -> None:
+    """Encodes byte blocks with quote_blocks, like url-encode --all"""
+    _blocks = url_encode.block_generator(BytesIO(data))
+    for _ in url_encode.quote_blocks(_blocks, b""):
+        pass
+
+
+def blocks(block_size: int, **kwargs: bool) -> Callable[[bytes], None]:
+    """Decodes byte blocks with decode_blocks"""
+
+    def _decode(data: bytes) -> None:
+        _blocks = url_decode.block_generator(BytesIO(data), block_size)
+        for _ in url_decode.decode_blocks(_blocks, **kwargs):
+            pass
+
+    return _decode
+
+
+def throughput(decode: Callable[[bytes], None], data: bytes) -> float:
+    """Returns the best MB/s of a few runs of a decoder over data"""
+    _best: float = float("inf")
+    for _ in range(3):
+        _start = time.perf_counter()
+        decode(data)
+        _best = min(_best, time.perf_counter() - _start)
+    return len(data) / _best / 1e6
+
+
+def main(size_mb: int) -> None:
+    """
+    Benchmarks the old and new decoders on a fake proxy log, once and twice encoded,
+    and the old and new encoders on the decoded log
+    """
+    _log = proxy_log(size_mb)
+    _twice = urllib.parse.quote_from_bytes(_log, safe=" \n").encode("ascii")
+    print(f"{'data':>8} {'implementation':>24} {'MB/s':>8}")
+    for _name, _data, _decoders in (
+        (
+            "once",
+            _log,
+            (
+                (f"baseline {BASELINE_BLOCK_SIZE}", baseline),
+                (f"bytes {BASELINE_BLOCK_SIZE}", blocks(BASELINE_BLOCK_SIZE)),
+                (
+                    f"bytes {url_decode.DEFAULT_BLOCK_SIZE}",
+                    blocks(url_decode.DEFAULT_BLOCK_SIZE),
+                ),
+            ),
+        ),
+        (
+            "twice",
+            _twice,
+            (
+                (
+                    f"recursive {url_decode.DEFAULT_BLOCK_SIZE}",
+                    blocks(url_decode.DEFAULT_BLOCK_SIZE, recursive=True),
+                ),
+            ),
+        ),
+        (
+            "decoded",
+            urllib.parse.unquote_to_bytes(_log),
+            (
+                (f"baseline --all {BASELINE_BLOCK_SIZE}", baseline_encode),
+                (f"table --all {url_encode.DEFAULT_BLOCK_SIZE}", encode),
+            ),
+        ),
+    ):
+        for _label, _decode in _decoders:
+            print(f"{_name:>8} {_label:>24} {throughput(_decode, _data):>8.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
@@ -0,0 +1,80 @@
+"""Throughput of zlib-deflate and zlib-inflate at different block sizes"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import base64
+import os
+import sys
+import time
+from collections.abc import Callable, Iterator
+from io import BytesIO
+from typing import BinaryIO
+
+from elastic.thrunting_tools.compression import zlib_deflate, zlib_inflate
+
+# The block size used before it was configurable, for comparison
+BASELINE_BLOCK_SIZE: int = 4096
+PAGE_SIZE: int = 4096
+
+
+def throughput(
+    generator: Callable[[BinaryIO, int], Iterator[bytes]], data: bytes, block_size: int
+) -> float:
+    """Returns the best MB/s of a few runs of a chunk generator over data"""
+    _best: float = float("inf")
+    for _ in range(3):
+        _start = time.perf_counter()
+        for _ in generator(BytesIO(data), block_size):
+            pass
+        _best = min(_best, time.perf_counter() - _start)
+    return len(data) / _best / 1e6
+
+
+def memory_capture(size_mb: int) -> bytes:
+    """
+    Fakes a memory capture: mostly zeroed pages, with some pages of base64 encoded
+    random data standing in for code and strings
+    """
+    _pages = []
+    for _ in range(size_mb * 1024 * 1024 // PAGE_SIZE):
+        if os.urandom(1)[0] < 64:
+            _pages.append(base64.b64encode(os.urandom(PAGE_SIZE * 3 // 4)))
+        else:
+            _pages.append(bytes(PAGE_SIZE))
+    return b"".join(_pages)
+
+
+def main(size_mb: int) -> None:
+    """Benchmarks both tools on a fake memory capture, and on zeroed memory"""
+    print(f"{'data':>8} {'block size':>12} {'deflate MB/s':>14} {'inflate MB/s':>14}")
+    for _name, _plain in (
+        ("capture", memory_capture(size_mb)),
+        ("zeroed", bytes(size_mb * 1024 * 1024)),
+    ):
+        _compressed = b"".join(zlib_deflate.chunk_generator(BytesIO(_plain)))
+        for _block_size in (BASELINE_BLOCK_SIZE, zlib_deflate.DEFAULT_BLOCK_SIZE):
+            _deflate = throughput(zlib_deflate.chunk_generator, _plain, _block_size)
+            # Inflate is measured against the size of its output, like deflate
+            _inflate = (
+                throughput(zlib_inflate.chunk_generator, _compressed, _block_size)
+                * len(_plain)
+                / len(_compressed)
+            )
+            print(f"{_name:>8} {_block_size:>12} {_deflate:>14.1f} {_inflate:>14.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
@@ -17,21 +17,246 @@
 # specific language governing permissions and limitations
 # under the License.
 import logging
+import struct
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
 from hashlib import sha256
 from pathlib import Path
-from typing import BinaryIO, Optional
+from typing import TYPE_CHECKING, Any, BinaryIO, List, Optional, TextIO, Tuple
 
-import pefile
 import typer
 
-from elastic.thrunting_tools.common.utils import stream, version_callback
+from elastic.thrunting_tools.common.utils import (
+    map_input,
+    stream,
+    version_callback,
+)
+
+if TYPE_CHECKING:
+    import pefile
 
 logger = logging.getLogger(__name__)
-MAX_CHUNK_SIZE: int = 4096
+UNMAPPED_SUFFIX: str = ".unmapped"
+MAX_PE_OFFSET: int = 0x1000
+MAX_HEADERS_SIZE: int = 0x10000
+STREAM_BLOCK_SIZE: int = 1024 * 1024
 
 app = typer.Typer(add_completion=False)
 
 
+def write_unmapped(
+    pe: "pefile.PE", data: Any, f_out: BinaryIO, shasum: Any = None
+) -> None:
+    """
+    Writes the headers of a mapped PE image, followed by the raw data of each section
+    read from its virtual address. Slices are views of `data`, nothing is copied. The
+    output is also fed to the `shasum` hash object, if given.
+    """
+    with memoryview(data) as _view:
+        _chunks = [_view[: pe.OPTIONAL_HEADER.SizeOfHeaders]]
+
+        _section: "pefile.SectionStructure"
+        for _section in pe.sections:
+            _start: int = _section.VirtualAddress
+            _chunks.append(_view[_start : _start + _section.SizeOfRawData])
+
+        for _chunk in _chunks:
+            f_out.write(_chunk)
+            if shasum is not None:
+                shasum.update(_chunk)
+            _chunk.release()
+
+
+def find_images(data: Any) -> Iterator[int]:
+    """
+    Yields the offset of every candidate PE image in a memory dump: an `MZ` header whose
+    `e_lfanew` points at a `PE\\0\\0` signature. The scan runs on `find`, so only the
+    (rare) `MZ` matches are inspected in Python.
+    """
+    _size: int = len(data)
+    _offset: int = data.find(b"MZ")
+    while _offset != -1 and _offset + 0x40 <= _size:
+        (_lfanew,) = struct.unpack_from("<I", data, _offset + 0x3C)
+        _signature: int = _offset + _lfanew
+        if 4 <= _lfanew <= MAX_PE_OFFSET:
+            if data[_signature : _signature + 4] == b"PE\0\0":
+                yield _offset
+        _offset = data.find(b"MZ", _offset + 1)
+
+
+def carve_images(data: Any, directory: Path) -> Iterator[Tuple[int, str, Path]]:
+    """
+    Unmaps every PE image found in a memory dump to `<offset>.unmapped` files in a
+    directory. Only the headers of each candidate are parsed, so false positives are
+    cheap to reject. Yields the offset, sha256 and path of each unmapped image.
+    """
+    import pefile  # pylint: disable=import-outside-toplevel
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with memoryview(data) as _view:
+        for _offset in find_images(data):
+            try:
+                _pe = pefile.PE(
+                    data=bytes(_view[_offset : _offset + MAX_HEADERS_SIZE]),
+                    fast_load=True,
+                )
+            except pefile.PEFormatError as err:
+                logger.debug("Skipping candidate at %#x: %s", _offset, err)
+                continue
+
+            _shasum = sha256()
+            _path_out = directory / f"{_offset:#x}{UNMAPPED_SUFFIX}"
+            with _path_out.open("wb") as f_out, _view[
+                _offset : _offset + _pe.OPTIONAL_HEADER.SizeOfImage
+            ] as _image:
+                write_unmapped(_pe, _image, f_out, _shasum)
+
+            yield _offset, _shasum.hexdigest(), _path_out
+
+
+def read_headers(f_in: BinaryIO) -> bytearray:
+    """
+    Reads just enough of a PE image from a stream to cover its headers and section
+    table. Stops short on anything that doesn't look like a PE, for pefile to reject.
+    """
+    _data = bytearray(f_in.read(0x40))
+    if len(_data) < 0x40 or _data[:2] != b"MZ":
+        return _data
+
+    (_lfanew,) = struct.unpack_from("<I", _data, 0x3C)
+    if _lfanew > MAX_PE_OFFSET:
+        return _data
+    # Up to and including SizeOfHeaders in the optional header
+    _data += f_in.read(max(0, _lfanew + 88 - len(_data)))
+    if len(_data) < _lfanew + 88:
+        return _data
+
+    _sections, _optional_size = struct.unpack_from("<H12xH", _data, _lfanew + 6)
+    (_headers_size,) = struct.unpack_from("<I", _data, _lfanew + 84)
+    _end: int = min(
+        max(_headers_size, _lfanew + 24 + _optional_size + 40 * _sections),
+        MAX_HEADERS_SIZE,
+    )
+    _data += f_in.read(max(0, _end - len(_data)))
+    return _data
+
+
+def stream_unmapped(
+    pe: "pefile.PE", headers: bytearray, f_in: BinaryIO, f_out: BinaryIO
+) -> None:
+    """
+    Unmaps a PE image while reading it from a stream, after its `headers` were read with
+    `read_headers`. Each range of the output is written as soon as the input reaches it,
+    only ranges that arrive before the one currently being written are held in memory.
+    """
+    _ranges: List[Tuple[int, int]] = [(0, pe.OPTIONAL_HEADER.SizeOfHeaders)]
+    _ranges.extend(
+        (_section.VirtualAddress, _section.VirtualAddress + _section.SizeOfRawData)
+        for _section in pe.sections
+    )
+    _pending: List[bytearray] = [bytearray() for _ in _ranges]
+    _next: int = 0  # the range currently being written
+
+    def _feed(offset: int, chunk: memoryview) -> None:
+        nonlocal _next
+        _end = offset + len(chunk)
+        for _idx in range(_next, len(_ranges)):
+            _start = max(_ranges[_idx][0], offset)
+            _stop = min(_ranges[_idx][1], _end)
+            if _start >= _stop:
+                continue
+            if _idx == _next:
+                f_out.write(chunk[_start - offset : _stop - offset])
+            else:
+                _pending[_idx] += chunk[_start - offset : _stop - offset]
+
+        while _next < len(_ranges) and _ranges[_next][1] <= _end:
+            _next += 1
+            if _next < len(_ranges):
+                f_out.write(_pending[_next])
+                _pending[_next] = bytearray()
+
+    _offset: int = len(headers)
+    _feed(0, memoryview(headers))
+    _read = getattr(f_in, "read1", f_in.read)
+    while _next < len(_ranges):
+        _chunk: bytes = _read(STREAM_BLOCK_SIZE)
+        if not _chunk:  # truncated image, write whatever was held back
+            for _buffer in _pending[_next + 1 :]:
+                f_out.write(_buffer)
+            break
+        _feed(_offset, memoryview(_chunk))
+        _offset += len(_chunk)
+
+
+def batch_paths(source: Path) -> List[Path]:
+    """
+    Lists the files to unmap in batch mode: the files in a directory, or the paths
+    listed one per line in a file (or standard in). Earlier outputs are skipped.
+    """
+    _paths: List[Path]
+    if source.is_dir():
+        _paths = sorted(_path for _path in source.iterdir() if _path.is_file())
+    else:
+        f_in: TextIO
+        with stream(source, "r") as f_in:
+            _paths = [Path(_line.strip()) for _line in f_in if _line.strip()]
+
+    return [_path for _path in _paths if _path.suffix != UNMAPPED_SUFFIX]
+
+
+def unmap_file(path: Path) -> Tuple[str, Path | None]:
+    """
+    Unmaps a PE file to a file of the same name with an `.unmapped` suffix alongside
+    it. Returns the sha256 of the input, and the output path or None if not a PE file.
+    Runs in a worker process in batch mode.
+    """
+    import pefile  # pylint: disable=import-outside-toplevel
+
+    _path_out = path.with_name(path.name + UNMAPPED_SUFFIX)
+    with path.open("rb") as f_in, map_input(f_in) as _data:
+        _shasum: str = sha256(_data).hexdigest()
+        try:
+            _pe = pefile.PE(data=_data, fast_load=True)
+        except pefile.PEFormatError:
+            return _shasum, None
+
+        with _path_out.open("wb") as f_out:
+            write_unmapped(_pe, _data, f_out)
+
+    return _shasum, _path_out
+
+
+def unmap_batch(paths: List[Path], workers: int | None = None) -> bool:
+    """
+    Unmaps many files across a pool of processes, as parsing PE headers is CPU bound.
+    Prints the sha256, input and output of each file in input order. Returns False if
+    any file couldn't be unmapped.
+    """
+    _ok: bool = True
+    with ProcessPoolExecutor(max_workers=workers) as _executor:
+        _futures: List[Future] = [
+            _executor.submit(unmap_file, _path) for _path in paths
+        ]
+        for _path, _future in zip(paths, _futures):
+            try:
+                _shasum, _path_out = _future.result()
+            except OSError as err:
+                logger.error("Unable to read %s: %s", _path, err)
+                _ok = False
+                continue
+
+            if _path_out is None:
+                logger.error(
+                    "Unable to process file as PE. sha256: %s path: %s", _shasum, _path
+                )
+                _ok = False
+            else:
+                typer.echo(f"{_shasum}\t{_path}\t{_path_out}")
+
+    return _ok
+
+
 @app.command()
 def unmap_pefile(
     path_in: Path = typer.Option(
@@ -54,6 +279,40 @@ def unmap_pefile(
         dir_okay=False,
         help="Filename for output stream",
     ),
+    batch: Optional[Path] = typer.Option(
+        None,
+        "--batch",
+        "-b",
+        allow_dash=True,
+        file_okay=True,
+        dir_okay=True,
+        help="Directory, or file listing paths (one per line), of PE files to unmap in "
+        "parallel. Outputs are written alongside each input with an .unmapped suffix",
+    ),
+    carve: Optional[Path] = typer.Option(
+        None,
+        "--carve",
+        "-c",
+        file_okay=False,
+        dir_okay=True,
+        writable=True,
+        help="Directory to unmap every PE image found anywhere in the input to, e.g. a "
+        "raw process or VAD dump",
+    ),
+    streaming: bool = typer.Option(
+        False,
+        "--stream",
+        "-s",
+        help="Write sections out as the input is read instead of reading it in full "
+        "first. Useful for large images piped in on standard in",
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        min=1,
+        help="Number of processes used by --batch [default: number of CPUs]",
+    ),
     version: Optional[bool] = typer.Option(  # pylint: disable=unused-argument
         None, "--version", callback=version_callback, help="Show version info and exit"
     ),
@@ -63,34 +322,61 @@ def unmap_pefile(
     captured from memory. Defaults to reading from standard in and writing to standard out.
     """
 
+    if batch is not None:
+        if str(path_in) != "-" or str(path_out) != "-" or carve or streaming:
+            raise typer.BadParameter(
+                "--batch cannot be combined with --input, --output, --carve or --stream"
+            )
+        if not unmap_batch(batch_paths(batch), workers):
+            raise typer.Exit(1)
+        return
+
     f_in: BinaryIO
     f_out: BinaryIO
-    shasum = sha256()
-
-    with stream(path_in, "rb") as f_in, stream(path_out, "wb") as f_out:
-        buff = bytearray()
-        while True:  # loop until EOF
-            _chunk: bytes = f_in.read(MAX_CHUNK_SIZE)
-            if not _chunk:  # An empty string is the end
-                break
-            buff.extend(_chunk)
-            shasum.update(_chunk)
-
-        pe: pefile.PE
+
+    if carve is not None:
+        if str(path_out) != "-" or streaming:
+            raise typer.BadParameter(
+                "--carve cannot be combined with --output or --stream"
+            )
+        _found: int = 0
+        with stream(path_in, "rb") as f_in, map_input(f_in) as data:
+            for _offset, _shasum, _path_out in carve_images(data, carve):
+                typer.echo(f"{_offset:#x}\t{_shasum}\t{_path_out}")
+                _found += 1
+        if not _found:
+            logger.error("No PE images found in input")
+            raise typer.Exit(1)
+        return
+
+    import pefile  # pylint: disable=import-outside-toplevel
+
+    pe: pefile.PE
+    if streaming:
+        with stream(path_in, "rb") as f_in:
+            _headers = read_headers(f_in)
+            try:
+                pe = pefile.PE(data=bytes(_headers), fast_load=True)
+            except pefile.PEFormatError:
+                logger.error("Unable to process stream as PE")
+                raise typer.Exit(1)  # pylint: disable=raise-missing-from
+
+            with stream(path_out, "wb") as f_out:
+                stream_unmapped(pe, _headers, f_in, f_out)
+        return
+
+    with stream(path_in, "rb") as f_in, map_input(f_in) as data:
         try:
-            pe = pefile.PE(data=buff)
+            # Only the headers and section table are needed, skip the data directories
+            pe = pefile.PE(data=data, fast_load=True)
         except pefile.PEFormatError:
-            logger.error("Unable to process file as PE. sha256: %s", shasum.hexdigest())
+            logger.error(
+                "Unable to process file as PE. sha256: %s", sha256(data).hexdigest()
+            )
             raise typer.Exit(1)  # pylint: disable=raise-missing-from
 
-        header_len: int = pe.OPTIONAL_HEADER.SizeOfHeaders
-        f_out.write(buff[:header_len])
-
-        entry: pefile.SectionStructure
-        for entry in pe.sections:
-            f_out.write(
-                buff[entry.VirtualAddress : entry.VirtualAddress + entry.SizeOfRawData]
-            )
+        with stream(path_out, "wb") as f_out:
+            write_unmapped(pe, data, f_out)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+"""asyncio query engine built on AsyncElasticsearch"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import asyncio
+import logging
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+)
+from contextlib import aclosing
+from importlib.util import find_spec
+from typing import Any, Dict, List, Tuple, TypeVar
+
+from elasticsearch import AsyncElasticsearch
+
+from elastic.thrunting_tools.common.elastic import (
+    DEFAULT_KEEP_ALIVE,
+    DEFAULT_MSEARCH_BATCH,
+    DEFAULT_PAGE_SIZE,
+    TIMESTAMP_SORT,
+    client_options,
+    msearch_batches,
+    msearch_results,
+)
+from elastic.thrunting_tools.common.settings import ElasticsearchSettings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def connect_async_elasticsearch(
+    settings: ElasticsearchSettings,
+) -> AsyncElasticsearch:
+    """Async counterpart of `connect_elasticsearch`. The caller must close the client"""
+    # The client only finds out aiohttp is missing once it's created, as a ValueError
+    if find_spec("aiohttp") is None:
+        raise RuntimeError(
+            "The async engine needs aiohttp, install 'thrunting-tools[async]'"
+        )
+    _es = AsyncElasticsearch(**client_options(settings))
+
+    if not settings.verify_connection:
+        logger.debug("Skipping Elasticsearch connection check")
+    elif await _es.ping():
+        logger.info("Successfully connected to Elasticsearch")
+    else:
+        await _es.close()
+        raise RuntimeError("Something went wrong with connecting to Elasticsearch")
+
+    return _es
+
+
+async def search_after_pages(
+    esclient: AsyncElasticsearch,
+    index: str,
+    query: Dict[str, Any],
+    page_size: int = DEFAULT_PAGE_SIZE,
+    keep_alive: str = DEFAULT_KEEP_ALIVE,
+    **kwargs: Any,
+) -> AsyncGenerator[List[Dict[str, Any]], None]:
+    """
+    Async counterpart of `search_after_hits` that yields whole pages. The request for
+    the next page is sent before the current page is handed to the caller, so the
+    network round trip overlaps with whatever the caller does with the page.
+    """
+    _pit: Dict[str, Any] = {
+        "id": (await esclient.open_point_in_time(index=index, keep_alive=keep_alive))[
+            "id"
+        ],
+        "keep_alive": keep_alive,
+    }
+
+    def _fetch(search_after: List[Any] | None) -> asyncio.Future:
+        return asyncio.ensure_future(
+            esclient.search(
+                pit=dict(_pit),
+                query=query,
+                sort=TIMESTAMP_SORT,
+                search_after=search_after,
+                size=page_size,
+                track_total_hits=False,
+                **kwargs,
+            )
+        )
+
+    _next: asyncio.Future = _fetch(None)
+    try:
+        while True:  # loop until a short page
+            _page = await _next
+            _pit["id"] = _page.get("pit_id", _pit["id"])
+            _hits: List[Dict[str, Any]] = _page["hits"]["hits"]
+            logger.debug("Fetched page of %s hits", len(_hits))
+
+            _more: bool = len(_hits) == page_size
+            if _more:
+                _next = _fetch(_hits[-1]["sort"])
+
+            yield _hits
+
+            if not _more:
+                break
+    finally:
+        _next.cancel()
+        await esclient.close_point_in_time(id=_pit["id"])
+
+
+async def msearch_pages(
+    esclient: AsyncElasticsearch,
+    index: str,
+    bodies: List[Dict[str, Any]],
+    batch_size: int = DEFAULT_MSEARCH_BATCH,
+) -> AsyncGenerator[List[Dict[str, Any]], None]:
+    """
+    Async counterpart of `msearch_hits`. The next `_msearch` batch is sent before the
+    hits of the current one are handed to the caller.
+    """
+    _batches = msearch_batches(index, bodies, batch_size)
+
+    def _fetch() -> asyncio.Future | None:
+        _searches = next(_batches, None)
+        if _searches is None:
+            return None
+        return asyncio.ensure_future(esclient.msearch(searches=_searches))
+
+    _next: asyncio.Future | None = _fetch()
+    try:
+        while _next is not None:
+            _responses = (await _next)["responses"]
+            _next = _fetch()
+            for _hits in msearch_results(_responses):
+                yield _hits
+    finally:
+        if _next is not None:
+            _next.cancel()
+
+
+async def ordered(
+    factories: List[Callable[[], Awaitable[T]]], workers: int | None = None
+) -> AsyncGenerator[T, None]:
+    """
+    Starts every coroutine factory at once, with at most `workers` running at a time,
+    and yields their results in the order the factories were given.
+    """
+    _limit = asyncio.Semaphore(workers or len(factories) or 1)
+
+    async def _run(factory: Callable[[], Awaitable[T]]) -> T:
+        async with _limit:
+            return await factory()
+
+    _tasks = [asyncio.ensure_future(_run(_factory)) for _factory in factories]
+    try:
+        for _task in _tasks:
+            yield await _task
+    finally:
+        for _task in _tasks:
+            _task.cancel()
+
+
+async def write_pages(
+    pages: AsyncIterator[T],
+    write: Callable[[T], bool],
+) -> None:
+    """
+    Hands each page to a blocking `write` callable on a worker thread, leaving the event
+    loop free to drive any prefetched requests. Stops once `write` returns False.
+    """
+    async with aclosing(pages):
+        async for _page in pages:
+            if not await asyncio.to_thread(write, _page):
+                break
+
+
+async def limit_pages(
+    pages: AsyncIterator[List[Dict[str, Any]]], size: int
+) -> AsyncGenerator[List[Dict[str, Any]], None]:
+    """Truncates a stream of pages once `size` hits have been yielded"""
+    async with aclosing(pages):
+        async for _page in pages:
+            if len(_page) >= size:
+                yield _page[:size]
+                return
+            size -= len(_page)
+            yield _page
+
+
+async def tag_pages(
+    tags: Iterable[T], pages: AsyncIterator[List[Dict[str, Any]]]
+) -> AsyncGenerator[Tuple[T, List[Dict[str, Any]]], None]:
+    """Pairs each page with its tag, e.g. the query that produced it"""
+    _tags = iter(tags)
+    async with aclosing(pages):
+        async for _page in pages:
+            yield next(_tags), _page
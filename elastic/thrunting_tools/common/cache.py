@@ -0,0 +1,139 @@
+"""On-disk cache of query results"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from elastic.thrunting_tools.common.datemath import EPOCH, isoformat, resolve
+
+logger = getLogger(__name__)
+
+DEFAULT_CACHE_TTL: int = 900
+MAX_CACHE_BYTES: int = 256 * 1024 * 1024
+CACHE_SUFFIX: str = ".json.gz"
+
+
+def cached_time_range(
+    since: str, before: str, ttl: int, now: datetime | None = None
+) -> Tuple[str, str]:
+    """
+    Resolves a date math time range to absolute timestamps for use in a cache key.
+    `now` is rounded down to a multiple of the TTL, so relative expressions like
+    `now-30d/d` resolve to the same range (and key) for the whole TTL window. The
+    resolved range must also be the one sent to Elasticsearch, so cached results always
+    match their key.
+    """
+    if now is None:
+        now = datetime.now(tz=timezone.utc)
+
+    _ttl = timedelta(seconds=max(ttl, 1))
+    _now = EPOCH + ((now - EPOCH) // _ttl) * _ttl
+
+    return isoformat(resolve(since, _now)), isoformat(resolve(before, _now))
+
+
+class ResultCache:
+    """
+    Stores the hits of a query as gzipped JSON, one file per key. Entries expire after
+    `ttl` seconds, and the least recently used entries are evicted once the directory
+    grows beyond `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        ttl: int = DEFAULT_CACHE_TTL,
+        max_bytes: int = MAX_CACHE_BYTES,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(**parts: Any) -> str:
+        """Derives a stable cache key from the parts of a request"""
+        return sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{CACHE_SUFFIX}"
+
+    def get(self, key: str) -> List[Dict[str, Any]] | None:
+        """Returns the cached hits for a key, or None if missing or expired"""
+        _path = self._path(key)
+        try:
+            _stat = _path.stat()
+        except FileNotFoundError:
+            return None
+
+        _now = time.time()
+        if _now - _stat.st_mtime > self.ttl:
+            logger.debug("Cache entry %s expired", key)
+            _path.unlink(missing_ok=True)
+            return None
+
+        try:
+            with gzip.open(_path, "rb") as f_in:
+                _hits: List[Dict[str, Any]] = json.load(f_in)
+        except (OSError, ValueError):
+            logger.warning("Discarding unreadable cache entry %s", _path)
+            _path.unlink(missing_ok=True)
+            return None
+
+        # The access time drives LRU eviction, keep the modification time for the TTL
+        os.utime(_path, (_now, _stat.st_mtime))
+        logger.info("Serving %s results from cache", len(_hits))
+        return _hits
+
+    def put(self, key: str, hits: List[Dict[str, Any]]) -> None:
+        """Stores hits for a key, then evicts old entries if over the size limit"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _path = self._path(key)
+        _tmp = _path.with_name(f".{_path.name}.{os.getpid()}")
+        with gzip.open(_tmp, "wb", compresslevel=1) as f_out:
+            f_out.write(json.dumps(hits).encode("utf-8"))
+        os.replace(_tmp, _path)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes expired entries, then least recently used ones until under size"""
+        _now = time.time()
+        _entries: List[Tuple[float, int, Path]] = []
+        for _path in self.directory.glob(f"*{CACHE_SUFFIX}"):
+            try:
+                _stat = _path.stat()
+            except FileNotFoundError:
+                continue
+            if _now - _stat.st_mtime > self.ttl:
+                _path.unlink(missing_ok=True)
+            else:
+                _entries.append((_stat.st_atime, _stat.st_size, _path))
+
+        _total = sum(_size for _, _size, _ in _entries)
+        for _, _size, _path in sorted(_entries):
+            if _total <= self.max_bytes:
+                break
+            logger.debug("Evicting cache entry %s", _path.name)
+            _path.unlink(missing_ok=True)
+            _total -= _size
@@ -0,0 +1,152 @@
+"""Resolve Elasticsearch date math expressions on the client side"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import re
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from typing import List, Tuple
+
+logger = getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+DATEMATH_OPERATION = re.compile(r"([+-])(\d+)([yMwdhHms])|/([yMwdhHms])")
+UNIT_DELTAS = {
+    "w": timedelta(weeks=1),
+    "d": timedelta(days=1),
+    "h": timedelta(hours=1),
+    "H": timedelta(hours=1),
+    "m": timedelta(minutes=1),
+    "s": timedelta(seconds=1),
+}
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    _month = value.month - 1 + months
+    _year = value.year + _month // 12
+    _month = _month % 12 + 1
+    # Clamp to the last day of the target month, like Elasticsearch does
+    _day = value.day
+    while True:
+        try:
+            return value.replace(year=_year, month=_month, day=_day)
+        except ValueError:
+            _day -= 1
+
+
+def _round_down(value: datetime, unit: str) -> datetime:
+    if unit == "y":
+        return value.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == "M":
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == "w":
+        _day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+        return _day - timedelta(days=_day.weekday())
+    if unit == "d":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit in ("h", "H"):
+        return value.replace(minute=0, second=0, microsecond=0)
+    if unit == "m":
+        return value.replace(second=0, microsecond=0)
+    return value.replace(microsecond=0)
+
+
+def _parse_anchor(anchor: str) -> datetime:
+    if anchor.isdigit():  # epoch_millis
+        return EPOCH + int(anchor) * MILLISECOND
+
+    _value = datetime.fromisoformat(anchor.replace("Z", "+00:00"))
+    if _value.tzinfo is None:
+        _value = _value.replace(tzinfo=timezone.utc)
+    return _value.astimezone(timezone.utc)
+
+
+def resolve(expression: str, now: datetime | None = None) -> datetime:
+    """
+    Resolves a date math expression (e.g. `now-30d/d` or `2022-11-01||+1M`) to an
+    absolute UTC datetime. Rounding always rounds down, matching the semantics of the
+    `gte` and `lt` bounds used by the query tools.
+    """
+    if now is None:
+        now = datetime.now(tz=timezone.utc)
+
+    expression = expression.strip()
+    if expression.startswith("now"):
+        _value, _math = now, expression[3:]
+    elif "||" in expression:
+        _anchor, _math = expression.split("||", 1)
+        _value = _parse_anchor(_anchor)
+    else:
+        return _parse_anchor(expression)
+
+    _pos = 0
+    while _pos < len(_math):
+        _match = DATEMATH_OPERATION.match(_math, _pos)
+        if _match is None:
+            raise ValueError(f"Unable to parse date math expression '{expression}'")
+        _sign, _amount, _unit, _rounding = _match.groups()
+
+        if _rounding is not None:
+            _value = _round_down(_value, _rounding)
+        else:
+            _count = int(_amount) if _sign == "+" else -int(_amount)
+            if _unit == "y":
+                _value = _add_months(_value, 12 * _count)
+            elif _unit == "M":
+                _value = _add_months(_value, _count)
+            else:
+                _value = _value + _count * UNIT_DELTAS[_unit]
+        _pos = _match.end()
+
+    return _value
+
+
+def isoformat(value: datetime) -> str:
+    """Formats a datetime in a way accepted by strict_date_optional_time"""
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def split_range(
+    since: str, before: str, slices: int, now: datetime | None = None
+) -> List[Tuple[str, str]]:
+    """
+    Splits the `[since, before)` time range into contiguous, non-overlapping windows
+    of (roughly) equal length, returned in chronological order.
+    """
+    if now is None:
+        now = datetime.now(tz=timezone.utc)
+
+    _start = resolve(since, now)
+    _end = resolve(before, now)
+    if _end <= _start:
+        raise ValueError(f"Time range '{since}' to '{before}' is empty")
+
+    # Work in whole milliseconds so adjacent windows never overlap or leave gaps
+    _start_ms = (_start - EPOCH) // MILLISECOND
+    _end_ms = (_end - EPOCH) // MILLISECOND
+    slices = max(1, min(slices, _end_ms - _start_ms))
+
+    _bounds = [
+        EPOCH + (_start_ms + (_end_ms - _start_ms) * _idx // slices) * MILLISECOND
+        for _idx in range(slices + 1)
+    ]
+    logger.debug("Split %s to %s into %s windows", _start, _end, slices)
+
+    return [
+        (isoformat(_lower), isoformat(_upper))
+        for _lower, _upper in zip(_bounds, _bounds[1:])
+    ]
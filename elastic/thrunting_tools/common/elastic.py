@@ -15,19 +15,41 @@
 # KIND, either express or implied.  See the License for the
 # specific language governing permissions and limitations
 # under the License.
+from __future__ import annotations
+
+import heapq
 import logging
-from typing import Tuple
+from collections.abc import Callable, Generator, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+from threading import Event, Thread
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 
-from elasticsearch import Elasticsearch
+if TYPE_CHECKING:  # the client libraries are slow to import, defer them
+    from elasticsearch import Elasticsearch
 
-from elastic.thrunting_tools.common.settings import ElasticsearchSettings
+    from elastic.thrunting_tools.common.settings import ElasticsearchSettings
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PAGE_SIZE: int = 1000
+DEFAULT_KEEP_ALIVE: str = "1m"
+DEFAULT_MSEARCH_BATCH: int = 100
+TIMESTAMP_SORT: List[Dict[str, Any]] = [
+    {"@timestamp": {"order": "asc", "unmapped_type": "date"}},
+    {"_shard_doc": "asc"},
+]
+# Newest first, for searches limited to the latest hits of a time range
+LATEST_SORT: List[Dict[str, Any]] = [
+    {"@timestamp": {"order": "desc", "unmapped_type": "date"}}
+]
 
-def connect_elasticsearch(settings: ElasticsearchSettings) -> Elasticsearch:
-    """Boilerplate to handle connecting to Elasticsearch"""
-    _es: Elasticsearch
+_PAGES_DONE = object()
+_CLIENTS: Dict[str, Elasticsearch] = {}
+
+
+def client_options(settings: ElasticsearchSettings) -> Dict[str, Any]:
+    """Builds the keyword arguments shared by the sync and async Elasticsearch clients"""
     _apikey: Tuple[str, str] | None = None
     _httpauth: Tuple[str, str] | None = None
 
@@ -42,39 +64,258 @@ def connect_elasticsearch(settings: ElasticsearchSettings) -> Elasticsearch:
     if settings.api_key:
         _apikey = tuple(settings.api_key.split(":"))
 
+    _options: Dict[str, Any] = {
+        "verify_certs": settings.ssl_verify,
+        "http_auth": _httpauth,
+        "api_key": _apikey,
+        "request_timeout": settings.request_timeout,
+        "max_retries": settings.max_retries,
+        "retry_on_timeout": settings.retry_on_timeout,
+        "http_compress": settings.http_compress,
+        "connections_per_node": settings.connections_per_node,
+    }
+
     if settings.cloud_id:
         logger.debug("Connecting to Elasticsearch using cloud_id %s", settings.cloud_id)
-
-        _es = Elasticsearch(
-            cloud_id=settings.cloud_id,
-            verify_certs=settings.ssl_verify,
-            http_auth=_httpauth,
-            api_key=_apikey,
-            request_timeout=30,
-            max_retries=10,
-            retry_on_timeout=True,
-        )
+        _options["cloud_id"] = settings.cloud_id
     else:
         logger.debug("Connecting to Elasticsearch using hosts: %s", settings.hosts)
+        _options["hosts"] = settings.hosts
 
-        _es = Elasticsearch(
-            hosts=settings.hosts,
-            verify_certs=settings.ssl_verify,
-            http_auth=_httpauth,
-            api_key=_apikey,
-            request_timeout=30,
-            max_retries=10,
-            retry_on_timeout=True,
-        )
+    return _options
+
+
+def connect_elasticsearch(settings: ElasticsearchSettings) -> Elasticsearch:
+    """
+    Boilerplate to handle connecting to Elasticsearch. Clients are reused for the life
+    of the process, so repeated calls with the same settings share one connection pool.
+    """
+    _key: str = settings.json()
+    if _key in _CLIENTS:
+        return _CLIENTS[_key]
 
-    if _es.ping():
+    from elasticsearch import (  # pylint: disable=import-outside-toplevel
+        Elasticsearch,
+    )
+
+    _es = Elasticsearch(**client_options(settings))
+
+    if not settings.verify_connection:
+        # Connection problems will surface on the first real request instead
+        logger.debug("Skipping Elasticsearch connection check")
+    elif _es.ping():
         logger.info("Successfully connected to Elasticsearch")
     else:
         raise RuntimeError("Something went wrong with connecting to Elasticsearch")
 
+    _CLIENTS[_key] = _es
     return _es
 
 
+def _walk_pit(
+    esclient: Elasticsearch,
+    pit: Dict[str, Any],
+    query: Dict[str, Any],
+    page_size: int,
+    **kwargs: Any,
+) -> Generator[List[Dict[str, Any]], None, None]:
+    """
+    Yields pages of hits for a point-in-time until a short page is returned. The `pit`
+    dictionary is updated in place with the latest PIT id returned by Elasticsearch.
+    """
+    _search_after: List[Any] | None = None
+
+    while True:  # loop until a short page
+        _page = esclient.search(
+            pit=dict(pit),
+            query=query,
+            sort=TIMESTAMP_SORT,
+            search_after=_search_after,
+            size=page_size,
+            track_total_hits=False,
+            **kwargs,
+        )
+        # The PIT id may change between requests, always use the latest one
+        pit["id"] = _page.get("pit_id", pit["id"])
+        _hits: List[Dict[str, Any]] = _page["hits"]["hits"]
+        logger.debug("Fetched page of %s hits", len(_hits))
+
+        yield _hits
+
+        if len(_hits) < page_size:
+            break
+        _search_after = _hits[-1]["sort"]
+
+
+def _pump_pages(pages: Iterator[List[Dict[str, Any]]], out: Queue, stop: Event) -> None:
+    """Thread target that moves pages into a bounded queue until told to stop"""
+    _item: Any = _PAGES_DONE
+    try:
+        for _item in pages:
+            while not stop.is_set():
+                try:
+                    out.put(_item, timeout=0.1)
+                    break
+                except Full:
+                    continue
+            else:
+                return
+        _item = _PAGES_DONE
+    except Exception as err:  # pylint: disable=broad-except
+        _item = err
+    out.put(_item)
+
+
+def _drain_pages(out: Queue) -> Generator[Dict[str, Any], None, None]:
+    while True:
+        _item = out.get()
+        if _item is _PAGES_DONE:
+            return
+        if isinstance(_item, Exception):
+            raise _item
+        yield from _item
+
+
+def search_after_hits(
+    esclient: Elasticsearch,
+    index: str,
+    query: Dict[str, Any],
+    page_size: int = DEFAULT_PAGE_SIZE,
+    keep_alive: str = DEFAULT_KEEP_ALIVE,
+    slices: int = 1,
+    **kwargs: Any,
+) -> Generator[Dict[str, Any], None, None]:
+    """
+    Streams every hit matching a query by opening a point-in-time and walking
+    `search_after` pages sorted by `@timestamp`. Each hit is yielded as soon as its
+    page arrives, so at most one page is held in memory regardless of result size.
+
+    With `slices` greater than one, the PIT is split into sliced searches that are
+    paged concurrently on worker threads and merged back into `@timestamp` order.
+    Memory is then bounded by roughly two pages per slice.
+    """
+    _pit: Dict[str, Any] = {
+        "id": esclient.open_point_in_time(index=index, keep_alive=keep_alive)["id"],
+        "keep_alive": keep_alive,
+    }
+
+    if slices <= 1:
+        try:
+            for _hits in _walk_pit(esclient, _pit, query, page_size, **kwargs):
+                yield from _hits
+        finally:
+            esclient.close_point_in_time(id=_pit["id"])
+        return
+
+    _stop = Event()
+    _queues: List[Queue] = []
+    for _slice in range(slices):
+        _queue: Queue = Queue(maxsize=1)
+        _pages = _walk_pit(
+            esclient,
+            dict(_pit),
+            query,
+            page_size,
+            slice={"id": _slice, "max": slices},
+            **kwargs,
+        )
+        Thread(target=_pump_pages, args=(_pages, _queue, _stop), daemon=True).start()
+        _queues.append(_queue)
+
+    try:
+        yield from heapq.merge(
+            *(_drain_pages(_queue) for _queue in _queues), key=lambda hit: hit["sort"]
+        )
+    finally:
+        _stop.set()
+        esclient.close_point_in_time(id=_pit["id"])
+
+
+def msearch_batches(
+    index: str, bodies: List[Dict[str, Any]], batch_size: int = DEFAULT_MSEARCH_BATCH
+) -> Generator[List[Dict[str, Any]], None, None]:
+    """Splits search bodies into `_msearch` request payloads of `batch_size` searches"""
+    for _offset in range(0, len(bodies), batch_size):
+        _searches: List[Dict[str, Any]] = []
+        for _body in bodies[_offset : _offset + batch_size]:
+            _searches.extend(({"index": index}, _body))
+        yield _searches
+
+
+def msearch_results(
+    responses: List[Dict[str, Any]]
+) -> Generator[List[Dict[str, Any]], None, None]:
+    """
+    Yields the hits of each `_msearch` response in order. Searches that failed are
+    logged and yield no hits so that one bad query doesn't sink the whole batch.
+    """
+    for _response in responses:
+        if "error" in _response:
+            logger.error("Search failed: %s", _response["error"].get("reason"))
+            yield []
+        else:
+            yield _response["hits"]["hits"]
+
+
+def msearch_hits(
+    esclient: Elasticsearch,
+    index: str,
+    bodies: List[Dict[str, Any]],
+    batch_size: int = DEFAULT_MSEARCH_BATCH,
+) -> Generator[List[Dict[str, Any]], None, None]:
+    """
+    Runs many search bodies against one index through `_msearch`, `batch_size` searches
+    per request, and yields the hits for each body in order.
+    """
+    for _searches in msearch_batches(index, bodies, batch_size):
+        yield from msearch_results(esclient.msearch(searches=_searches)["responses"])
+
+
+def fan_out(
+    func: Callable[[str, str], Iterable[Dict[str, Any]]],
+    windows: List[Tuple[str, str]],
+    workers: int | None = None,
+) -> Generator[Dict[str, Any], None, None]:
+    """
+    Runs `func(since, before)` for every time window on a thread pool and yields the
+    results window by window. Windows are chronological and disjoint, so results that
+    are sorted by `@timestamp` within each window come out in global timestamp order.
+    """
+    with ThreadPoolExecutor(max_workers=workers or len(windows)) as pool:
+        _futures = [
+            pool.submit(lambda w: list(func(*w)), _window) for _window in windows
+        ]
+        try:
+            for _future in _futures:
+                yield from _future.result()
+        finally:
+            for _future in _futures:
+                _future.cancel()
+
+
+def tail_events(
+    pages: Iterable[List[Dict[str, Any]]], size: int
+) -> List[Dict[str, Any]]:
+    """
+    Merges the pages of events found in time windows, given newest window first, into
+    the last `size` events of the whole time range in chronological order. Each page
+    must be the latest events of its window in chronological order, as returned by EQL
+    with `result_position: tail`. Stops reading pages once `size` events are found.
+    """
+    _pages: List[List[Dict[str, Any]]] = []
+    _count: int = 0
+    for _page in pages:
+        _pages.append(_page)
+        _count += len(_page)
+        if _count >= size:
+            break
+
+    _events = [_event for _page in reversed(_pages) for _event in _page]
+    return _events[max(len(_events) - size, 0) :] if size > 0 else []
+
+
 if __name__ == "__main__":
+    from elastic.thrunting_tools.common import settings
+
     logging.basicConfig(level=logging.DEBUG)
-    connect_elasticsearch(ElasticsearchSettings())
+    connect_elasticsearch(settings.ElasticsearchSettings())
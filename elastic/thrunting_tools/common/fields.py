@@ -0,0 +1,129 @@
+"""Projection of selected fields out of search hits"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from collections.abc import Callable
+from typing import Any, Dict, List, Tuple
+
+Accessor = Callable[[Dict[str, Any]], Any]
+Projection = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+MISSING = object()
+
+
+def compile_accessor(field: str) -> Accessor:
+    """
+    Compiles a dotted field name into a function that looks the field up in a
+    document. Nested objects are walked first; when that fails, keys containing dots
+    (e.g. ECS documents indexed as `{"host.name": ...}`) are tried at every level.
+    Returns `MISSING` when the field isn't present.
+    """
+    _parts: Tuple[str, ...] = tuple(field.split("."))
+    _count = len(_parts)
+    # _keys[start][end] is the literal key for _parts[start:end]
+    _keys: List[List[str]] = [
+        [".".join(_parts[_start:_end]) for _end in range(_count + 1)]
+        for _start in range(_count)
+    ]
+
+    def _flattened(node: Dict[str, Any], start: int) -> Any:
+        for _end in range(start + 1, _count + 1):
+            _value = node.get(_keys[start][_end], MISSING)
+            if _value is MISSING:
+                continue
+            if _end == _count:
+                return _value
+            if isinstance(_value, dict):
+                _value = _flattened(_value, _end)
+                if _value is not MISSING:
+                    return _value
+        return MISSING
+
+    def _accessor(doc: Dict[str, Any]) -> Any:
+        _node: Any = doc
+        for _part in _parts:
+            if not isinstance(_node, dict) or _part not in _node:
+                return _flattened(doc, 0)
+            _node = _node[_part]
+        return _node
+
+    return _accessor
+
+
+def compile_fields(fields: List[str], base: str = "_source") -> Projection:
+    """
+    Compiles a list of fields into a projection that builds a nested view of a hit
+    containing only those fields, read from the `base` object of the hit. Paths are
+    split once up front so each hit only pays for dictionary lookups.
+    """
+    _plan: List[Tuple[Accessor, Tuple[str, ...], str]] = []
+    for _field in fields:
+        *_parents, _leaf = _field.split(".")
+        _plan.append((compile_accessor(_field), tuple(_parents), _leaf))
+
+    def _projection(hit: Dict[str, Any]) -> Dict[str, Any]:
+        _doc: Dict[str, Any] = hit.get(base) or {}
+        _view: Dict[str, Any] = {}
+        for _accessor, _parents, _leaf in _plan:
+            _value = _accessor(_doc)
+            if _value is MISSING or _value is None:
+                continue
+
+            _node = _view
+            for _parent in _parents:
+                _node = _node.setdefault(_parent, {})
+                if not isinstance(_node, dict):
+                    break
+            else:
+                _node.setdefault(_leaf, _value)
+        return _view
+
+    return _projection
+
+
+def source_filter(
+    fields: List[str] | None, excludes: List[str] | None = None
+) -> Dict[str, Any]:
+    """
+    Builds search API keyword arguments that make Elasticsearch trim `_source` down to
+    the requested fields before it is sent, rather than fetching whole documents and
+    projecting them on the client.
+    """
+    _source: Dict[str, List[str]] = {}
+    if fields:
+        _source["includes"] = fields
+    if excludes:
+        _source["excludes"] = excludes
+
+    return {"source": _source} if _source else {}
+
+
+def response_filter(
+    prefix: str, fields: List[str] | None, excludes: List[str] | None = None
+) -> Dict[str, Any]:
+    """
+    Builds a `filter_path` for APIs that don't support `_source` filtering, such as EQL
+    search. Only `hits.total`, the id and the requested `_source` fields of each hit
+    under `prefix` (e.g. `hits.events`) are kept in the response.
+    """
+    _paths: List[str] = []
+    if fields:
+        _paths.extend(("hits.total", f"{prefix}._id"))
+        _paths.extend(f"{prefix}._source.{_field}" for _field in fields)
+    if excludes:
+        _paths.extend(f"-{prefix}._source.{_field}" for _field in excludes)
+
+    return {"filter_path": _paths} if _paths else {}
@@ -0,0 +1,95 @@
+"""Serialization of query results to standard out"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import json
+import os
+import sys
+from collections.abc import Iterable
+from logging import getLogger
+from typing import Any, BinaryIO, Dict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+logger = getLogger(__name__)
+
+MAX_PENDING_LINES: int = 256
+
+
+def dumps(obj: Dict[str, Any]) -> bytes:
+    """
+    Serializes a document to compact JSON bytes with sorted keys. Uses orjson when it
+    is installed, falling back to the standard library for anything orjson rejects
+    (e.g. integers wider than 64 bits).
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except orjson.JSONEncodeError:
+            pass
+
+    return json.dumps(
+        obj, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def write_ndjson(docs: Iterable[Dict[str, Any]], f_out: BinaryIO) -> int:
+    """
+    Writes one compact JSON document per line. Lines are batched into a single write
+    so that large result sets don't pay for a write call per document.
+    """
+    _count: int = 0
+    _pending: list[bytes] = []
+    for _doc in docs:
+        _pending.append(dumps(_doc))
+        _count += 1
+        if len(_pending) >= MAX_PENDING_LINES:
+            _pending.append(b"")
+            f_out.write(b"\n".join(_pending))
+            _pending.clear()
+
+    if _pending:
+        _pending.append(b"")
+        f_out.write(b"\n".join(_pending))
+    f_out.flush()
+    return _count
+
+
+def print_results(docs: Iterable[Dict[str, Any]], compact: bool) -> bool:
+    """
+    Prints query results to standard out. Compact output is written as NDJSON straight
+    to the binary stdout buffer, otherwise documents are pretty printed with rich.
+    Returns False if the reader closed the output stream.
+    """
+    try:
+        if compact:
+            write_ndjson(docs, sys.stdout.buffer)
+        else:
+            from rich import print_json  # pylint: disable=import-outside-toplevel
+
+            for _doc in docs:
+                print_json(data=_doc, indent=4, sort_keys=True)
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`), silence the error on interpreter exit
+        logger.debug("Output stream closed early")
+        _devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(_devnull, sys.stdout.fileno())
+        return False
+
+    return True
@@ -34,6 +34,12 @@ class ElasticsearchSettings(BaseSettings):
     api_key: Optional[str]
     ssl_verify: bool = True
     default_index: str = ".alerts-security.alerts-default,apm-*-transaction*,logs-*"
+    request_timeout: float = 30
+    max_retries: int = 10
+    retry_on_timeout: bool = True
+    http_compress: bool = False
+    connections_per_node: int = 10
+    verify_connection: bool = True
 
     class Config:
         "Configures pydantic model"
@@ -45,6 +51,12 @@ class ElasticsearchSettings(BaseSettings):
             "password": {"env": "ES_PASS"},
             "ssl_verify": {"env": "ES_SSL_VERIFY"},
             "default_index": {"env": "ES_INDEX"},
+            "request_timeout": {"env": "ES_REQUEST_TIMEOUT"},
+            "max_retries": {"env": "ES_MAX_RETRIES"},
+            "retry_on_timeout": {"env": "ES_RETRY_ON_TIMEOUT"},
+            "http_compress": {"env": "ES_HTTP_COMPRESS"},
+            "connections_per_node": {"env": "ES_CONNECTIONS_PER_NODE"},
+            "verify_connection": {"env": "ES_VERIFY_CONNECTION"},
         }
 
         @classmethod
@@ -16,16 +16,16 @@
 # specific language governing permissions and limitations
 # under the License.
 
+import io
+import mmap
 import sys
-from collections.abc import Generator
+from collections.abc import Generator, Iterator
 from contextlib import contextmanager
-from importlib.metadata import version
 from logging import getLogger
 from pathlib import Path
 from typing import Any, BinaryIO, Dict, List, TextIO
 
 import typer
-from ruamel.yaml import YAML
 
 logger = getLogger(__name__)
 
@@ -37,6 +37,9 @@ def choose_config_entry(config: Path, group: str, name: str = None) -> Dict[str,
     """
     _config = []
     if config is not None and config.exists():
+        # pylint: disable=import-outside-toplevel
+        from ruamel.yaml import YAML
+
         logger.info("Reading configuration from %s", config)
         yaml = YAML()
         _config: List[Dict[str, Any]] = yaml.load(config.read_text())
@@ -60,8 +63,38 @@ def choose_config_entry(config: Path, group: str, name: str = None) -> Dict[str,
         return {}
 
 
+def read_queries(path: Path) -> List[str]:
+    """
+    Reads a batch of queries from a file, or standard in when `path` is `-`. YAML files
+    (`.yml`/`.yaml`) hold a list of query strings or of mappings with a `query` key;
+    anything else is read as one query per line, skipping blanks and `#` comments.
+    """
+    with stream(path, "r") as f_in:
+        _text: str = f_in.read()
+
+    if path.suffix in (".yml", ".yaml"):
+        from ruamel.yaml import YAML  # pylint: disable=import-outside-toplevel
+
+        yaml = YAML(typ="safe")
+        _entries: List[Any] = yaml.load(_text) or []
+        return [
+            _entry["query"] if isinstance(_entry, dict) else str(_entry)
+            for _entry in _entries
+        ]
+
+    return [
+        _line.strip()
+        for _line in _text.splitlines()
+        if _line.strip() and not _line.lstrip().startswith("#")
+    ]
+
+
 def version_callback(value: bool):
     if value:
+        from importlib.metadata import (  # pylint: disable=import-outside-toplevel
+            version,
+        )
+
         _version = version("thrunting-tools")
         print(f"Elastic Security Labs Thrunting Tools, {_version}")
         print("https://github.com/elastic/securitylabs-thrunting-tools")
@@ -81,3 +114,22 @@ def stream(arg: Path, mode: str = "r") -> Generator[TextIO | BinaryIO, None, Non
     else:
         with arg.open(mode) as handle:
             yield handle
+
+
+@contextmanager
+def map_input(f_in: BinaryIO) -> Iterator[Any]:
+    """
+    Maps a file into memory read-only, so large dumps are paged in on demand instead of
+    copied. Inputs that can't be mapped, like pipes or empty files, are read in full.
+    """
+    _mapped: mmap.mmap | None
+    try:
+        _mapped = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        _mapped = None
+
+    if _mapped is None:
+        yield f_in.read()
+    else:
+        with _mapped:
+            yield _mapped
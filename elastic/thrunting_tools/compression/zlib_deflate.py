@@ -1,26 +1,169 @@
 #!/usr/bin/env python3
+import struct
 import sys
+import time
 import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum
+from io import BytesIO
 from pathlib import Path
-from typing import BinaryIO, Optional
+from typing import Any, BinaryIO, Deque, Dict, Iterator, Optional, Tuple
 
 import typer
 
 from elastic.thrunting_tools.common.utils import stream, version_callback
 
-MAX_CHUNK_SIZE: int = 4096
+DEFAULT_BLOCK_SIZE: int = 1024 * 1024
+ADLER_BASE: int = 65521
+WINDOW_SIZE: int = 32 * 1024
+
+
+class Strategy(str, Enum):
+    """zlib compression strategies"""
+
+    DEFAULT = "default"
+    FILTERED = "filtered"
+    HUFFMAN = "huffman"
+    RLE = "rle"
+    FIXED = "fixed"
+
+
+STRATEGIES: Dict[Strategy, int] = {
+    Strategy.DEFAULT: zlib.Z_DEFAULT_STRATEGY,
+    Strategy.FILTERED: zlib.Z_FILTERED,
+    Strategy.HUFFMAN: zlib.Z_HUFFMAN_ONLY,
+    Strategy.RLE: zlib.Z_RLE,
+    Strategy.FIXED: zlib.Z_FIXED,
+}
 
 app = typer.Typer(add_completion=False)
 
 
-def chunk_generator(stream_in: BinaryIO) -> str:
-    _deflator = zlib.compressobj()
+def compressobj(
+    level: int = zlib.Z_DEFAULT_COMPRESSION,
+    strategy: Strategy = Strategy.DEFAULT,
+    wbits: int = zlib.MAX_WBITS,
+    zdict: bytes | None = None,
+) -> Any:
+    """Creates a compressor, as zlib.compressobj won't take None for no dictionary"""
+    _kwargs: Dict[str, Any] = {"zdict": zdict} if zdict else {}
+    return zlib.compressobj(
+        level, zlib.DEFLATED, wbits, strategy=STRATEGIES[strategy], **_kwargs
+    )
+
+
+def chunk_generator(
+    stream_in: BinaryIO,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    level: int = zlib.Z_DEFAULT_COMPRESSION,
+    strategy: Strategy = Strategy.DEFAULT,
+    wbits: int = zlib.MAX_WBITS,
+    zdict: bytes | None = None,
+) -> Iterator[bytes]:
+    _deflator = compressobj(level, strategy, wbits, zdict)
+    # One buffer is reused for every read, zlib copies what it needs out of it
+    _buffer = bytearray(block_size)
+    _view = memoryview(_buffer)
     while True:  # Loop until EOF
-        _chunk = stream_in.read(MAX_CHUNK_SIZE)
-        if not _chunk:
+        _size = stream_in.readinto(_buffer)
+        if not _size:
             yield _deflator.flush()
             break
-        yield _deflator.compress(_chunk)
+        yield _deflator.compress(_view[:_size])
+
+
+def adler32_combine(adler1: int, adler2: int, len2: int) -> int:
+    """
+    Combines the Adler-32 checksums of two adjacent pieces of data into the checksum of
+    both, given the length of the second. A port of zlib's adler32_combine.
+    """
+    _rem = len2 % ADLER_BASE
+    _sum1 = adler1 & 0xFFFF
+    _sum2 = (_rem * _sum1) % ADLER_BASE
+    _sum1 += (adler2 & 0xFFFF) + ADLER_BASE - 1
+    _sum2 += (adler1 >> 16) + (adler2 >> 16) + ADLER_BASE - _rem
+    return (_sum1 % ADLER_BASE) | ((_sum2 % ADLER_BASE) << 16)
+
+
+def _deflate_block(
+    block: bytes, zdict: bytes, level: int, strategy: Strategy
+) -> Tuple[bytes, int]:
+    # Raw deflate, primed with the end of the previous block so matches can reach back
+    # into it, and ends on a byte boundary so the blocks can simply be concatenated
+    _deflator = compressobj(level, strategy, -zlib.MAX_WBITS, zdict)
+    _data = _deflator.compress(block) + _deflator.flush(zlib.Z_SYNC_FLUSH)
+    return _data, zlib.adler32(block)
+
+
+def parallel_chunk_generator(
+    stream_in: BinaryIO,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    threads: int = 2,
+    level: int = zlib.Z_DEFAULT_COMPRESSION,
+    strategy: Strategy = Strategy.DEFAULT,
+) -> Iterator[bytes]:
+    """
+    Compresses blocks of the input on several threads at once, like pigz. zlib releases
+    the GIL while compressing. The blocks are stitched back into a single zlib stream,
+    with the Adler-32 checksums of each block combined for the trailer.
+    """
+    _pending: Deque[Tuple[Future, int]] = deque()
+    _checksum: int = 1  # Adler-32 of no data
+
+    yield zlib.compress(b"", level)[:2]  # zlib header for the level
+    with ThreadPoolExecutor(max_workers=threads) as _executor:
+        _zdict: bytes = b""
+        while True:  # Loop until EOF
+            _block = stream_in.read(block_size)
+            if _block:
+                _pending.append(
+                    (
+                        _executor.submit(
+                            _deflate_block, _block, _zdict, level, strategy
+                        ),
+                        len(_block),
+                    )
+                )
+                if len(_block) >= WINDOW_SIZE:
+                    _zdict = _block[-WINDOW_SIZE:]
+                else:
+                    _zdict = (_zdict + _block)[-WINDOW_SIZE:]
+
+            # Keep a couple of blocks queued per thread, and drain the rest at EOF
+            while _pending and (not _block or len(_pending) > 2 * threads):
+                _future, _size = _pending.popleft()
+                _data, _adler = _future.result()
+                _checksum = adler32_combine(_checksum, _adler, _size)
+                yield _data
+
+            if not _block:
+                break
+
+    yield zlib.compressobj(wbits=-15).flush()  # empty final block
+    yield struct.pack(">I", _checksum)
+
+
+def benchmark_levels(
+    data: bytes,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    strategy: Strategy = Strategy.DEFAULT,
+    wbits: int = zlib.MAX_WBITS,
+    zdict: bytes | None = None,
+) -> Iterator[Tuple[int, float, float]]:
+    """Compresses data at every level, yielding the level, MB/s and compression ratio"""
+    for _level in range(10):
+        _start = time.perf_counter()
+        _size = sum(
+            map(
+                len,
+                chunk_generator(
+                    BytesIO(data), block_size, _level, strategy, wbits, zdict
+                ),
+            )
+        )
+        _elapsed = time.perf_counter() - _start
+        yield _level, len(data) / max(_elapsed, 1e-9) / 1e6, len(data) / _size
 
 
 @app.command()
@@ -45,13 +188,86 @@ def zlib_deflate(
         dir_okay=False,
         help="Filename for output stream",
     ),
+    block_size: int = typer.Option(
+        DEFAULT_BLOCK_SIZE,
+        "--block-size",
+        "-b",
+        min=1,
+        help="Number of bytes read from the input at a time",
+    ),
+    threads: int = typer.Option(
+        1,
+        "--threads",
+        "-t",
+        min=1,
+        help="Number of threads compressing blocks of the input in parallel",
+    ),
+    level: int = typer.Option(
+        zlib.Z_DEFAULT_COMPRESSION,
+        "--level",
+        "-l",
+        min=-1,
+        max=9,
+        help="Compression level, from 0 (none) and 1 (fastest) to 9 (smallest)",
+    ),
+    strategy: Strategy = typer.Option(
+        Strategy.DEFAULT,
+        "--strategy",
+        case_sensitive=False,
+        help="Compression strategy, tuning the algorithm for the type of data",
+    ),
+    wbits: int = typer.Option(
+        zlib.MAX_WBITS,
+        "--wbits",
+        help="Window size and container: 9 to 15 for zlib, -9 to -15 for raw deflate "
+        "and 25 to 31 for gzip",
+    ),
+    zdict: Optional[Path] = typer.Option(
+        None,
+        "--zdict",
+        exists=True,
+        readable=True,
+        file_okay=True,
+        dir_okay=False,
+        help="File with a preset dictionary of byte sequences expected in the input",
+    ),
+    benchmark: bool = typer.Option(
+        False,
+        "--benchmark",
+        help="Compress the input at every level, and print the MB/s and ratio of each "
+        "instead of the compressed data",
+    ),
     version: Optional[bool] = typer.Option(  # pylint: disable=unused-argument
         None, "--version", callback=version_callback, help="Show version info and exit"
     ),
 ):
+    """
+    Compresses (deflates) a file with zlib. Defaults to reading from standard in and
+    writing to standard out.
+    """
+    _zdict: bytes | None = zdict.read_bytes() if zdict is not None else None
+    try:
+        compressobj(level, strategy, wbits, _zdict)
+    except ValueError as err:
+        raise typer.BadParameter(str(err))  # pylint: disable=raise-missing-from
+    if threads > 1 and (wbits != zlib.MAX_WBITS or _zdict):
+        raise typer.BadParameter("--threads cannot be combined with --wbits or --zdict")
+
+    if benchmark:
+        with stream(path_in, "rb") as f_in:
+            _data: bytes = f_in.read()
+        typer.echo(f"{'level':>5} {'MB/s':>10} {'ratio':>8}")
+        for _level, _speed, _ratio in benchmark_levels(
+            _data, block_size, strategy, wbits, _zdict
+        ):
+            typer.echo(f"{_level:>5} {_speed:>10.1f} {_ratio:>8.2f}")
+        return
 
     with stream(path_in, "rb") as f_in, stream(path_out, "wb") as f_out:
-        gen = chunk_generator(f_in)
+        if threads > 1:
+            gen = parallel_chunk_generator(f_in, block_size, threads, level, strategy)
+        else:
+            gen = chunk_generator(f_in, block_size, level, strategy, wbits, _zdict)
         for chunk in gen:
             f_out.write(chunk)
 
@@ -1,25 +1,228 @@
 #!/usr/bin/env python3
+import logging
+import re
 import zlib
+from enum import Enum
 from pathlib import Path
-from typing import BinaryIO, Optional
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
 
 import typer
 
-from elastic.thrunting_tools.common.utils import stream, version_callback
+from elastic.thrunting_tools.common.utils import map_input, stream, version_callback
 
-MAX_CHUNK_SIZE: int = 4096
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE: int = 1024 * 1024
+PROBE_SIZE: int = 1024
+MIN_RATIO_OUTPUT: int = 1024 * 1024
+# zlib headers at each compression level, and gzip headers using deflate
+STREAM_HEADER = re.compile(rb"\x78[\x01\x5e\x9c\xda]|\x1f\x8b\x08")
+
+
+class Format(str, Enum):
+    """Container formats of deflate streams"""
+
+    AUTO = "auto"
+    ZLIB = "zlib"
+    GZIP = "gzip"
+    RAW = "raw"
+
+
+FORMAT_WBITS: Dict[Format, int] = {
+    Format.ZLIB: zlib.MAX_WBITS,
+    Format.GZIP: 16 + zlib.MAX_WBITS,
+    Format.RAW: -zlib.MAX_WBITS,
+}
 
 app = typer.Typer(add_completion=False)
 
 
-def chunk_generator(stream_in: BinaryIO) -> str:
-    _inflator = zlib.decompressobj()
+class InflateLimitError(ValueError):
+    """Raised when the inflated output grows past its limits"""
+
+
+class OutputLimit:
+    """
+    Guards against decompression bombs, by counting the input consumed and the output
+    produced while inflating. Raises InflateLimitError once the output grows past
+    `max_size` bytes, or past `max_ratio` times the input (after the first
+    MIN_RATIO_OUTPUT bytes, as small inputs can legitimately have large ratios).
+    """
+
+    def __init__(self, max_size: int | None = None, max_ratio: float | None = None):
+        self.max_size = max_size
+        self.max_ratio = max_ratio
+        self.size_in: int = 0
+        self.size_out: int = 0
+
+    def update(self, size_in: int, size_out: int) -> None:
+        """Counts more input and output, raising if the output is now over a limit"""
+        self.size_in += size_in
+        self.size_out += size_out
+        if self.max_size is not None and self.size_out > self.max_size:
+            raise InflateLimitError(
+                f"Inflated output exceeds the limit of {self.max_size} bytes"
+            )
+        if (
+            self.max_ratio is not None
+            and self.size_out > MIN_RATIO_OUTPUT
+            and self.size_out > self.max_ratio * self.size_in
+        ):
+            raise InflateLimitError(
+                f"Inflated output exceeds {self.max_ratio} times the input "
+                f"({self.size_out} bytes from {self.size_in})"
+            )
+
+
+def sniff_format(header: bytes) -> Format:
+    """Tells gzip and zlib streams apart by their header, anything else is raw deflate"""
+    if header[:2] == b"\x1f\x8b":
+        return Format.GZIP
+    if (
+        len(header) >= 2
+        and header[0] & 0x0F == 8  # deflate
+        and header[0] >> 4 <= 7  # window size
+        and (header[0] << 8 | header[1]) % 31 == 0  # header checksum
+    ):
+        return Format.ZLIB
+    return Format.RAW
+
+
+def inflate_block(
+    inflator: Any, data: Any, block_size: int, limit: OutputLimit | None = None
+) -> Iterator[bytes]:
+    """
+    Inflates a block of input in pieces of at most `block_size` bytes, by feeding
+    `unconsumed_tail` back in. Memory use stays constant however well the input was
+    compressed, and the limit is checked before each piece is handed out.
+    """
+    while True:
+        _chunk: bytes = inflator.decompress(data, block_size)
+        _tail: bytes = inflator.unconsumed_tail
+        if limit is not None:
+            limit.update(len(data) - len(_tail), len(_chunk))
+        yield _chunk
+
+        data = _tail
+        if inflator.eof or (not data and len(_chunk) < block_size):
+            break
+
+
+def chunk_generator(
+    stream_in: BinaryIO,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    fmt: Format = Format.ZLIB,
+    limit: OutputLimit | None = None,
+    zdict: bytes | None = None,
+) -> Iterator[bytes]:
+    _inflator = None
+    # One buffer is reused for every read, zlib copies what it needs out of it
+    _buffer = bytearray(block_size)
+    _view = memoryview(_buffer)
     while True:  # Loop until EOF
-        _chunk = stream_in.read(MAX_CHUNK_SIZE)
-        if not _chunk:  # an empty string is the end
-            yield _inflator.flush()
+        _size = stream_in.readinto(_buffer)
+        if not _size:  # nothing read is the end
+            if _inflator is not None:
+                yield _inflator.flush()
             break
-        yield _inflator.decompress(_chunk)
+        _data = _view[:_size]
+        if _inflator is None:
+            if fmt == Format.AUTO:
+                fmt = sniff_format(bytes(_data[:2]))
+                logger.debug("Detected %s stream", fmt.value)
+            _inflator = (
+                zlib.decompressobj(FORMAT_WBITS[fmt], zdict=zdict)
+                if zdict
+                else zlib.decompressobj(FORMAT_WBITS[fmt])
+            )
+        yield from inflate_block(_inflator, _data, block_size, limit)
+
+
+def inflate_at(
+    data: Any,
+    offset: int,
+    fmt: Format,
+    f_out: BinaryIO,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    limit: OutputLimit | None = None,
+) -> int | None:
+    """
+    Inflates the stream starting at `offset` in `data` into `f_out`. Returns the length
+    of the compressed stream, or None if it is corrupt or truncated. Raises
+    InflateLimitError if the output grows past the limit.
+    """
+    _inflator = zlib.decompressobj(FORMAT_WBITS[fmt])
+    _view = memoryview(data)
+    _pos: int = offset
+    _data: Any = b""
+    try:
+        while not _inflator.eof and _pos < len(_view):
+            _data = _view[_pos : _pos + block_size]
+            _pos += len(_data)
+            f_out.writelines(inflate_block(_inflator, _data, block_size, limit))
+    except zlib.error:
+        return None
+    finally:
+        _data = None  # let go of the slice, so the view can be released
+        _view.release()
+
+    if not _inflator.eof:
+        return None
+    return _pos - offset - len(_inflator.unused_data)
+
+
+def scan_streams(
+    data: Any,
+    directory: Path,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    max_size: int | None = None,
+    max_ratio: float | None = None,
+) -> Iterator[Tuple[int, Format, int, Path]]:
+    """
+    Finds and inflates every complete zlib and gzip stream embedded in `data`, writing
+    each to `<offset>.inflated` in a directory. Candidates are found with a regular
+    expression over their headers, and must inflate their first bytes without errors
+    before they are inflated in full. Yields the offset, format, compressed length and
+    output path of each stream. Raw deflate has no header, so it can't be found.
+    Streams that inflate past `max_size` or `max_ratio` are skipped.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    _pos: int = 0
+    while (_match := STREAM_HEADER.search(data, _pos)) is not None:
+        _offset = _match.start()
+        _pos = _offset + 1
+        _fmt = sniff_format(_match.group())
+        try:
+            zlib.decompressobj(FORMAT_WBITS[_fmt]).decompress(
+                data[_offset : _offset + PROBE_SIZE], PROBE_SIZE
+            )
+        except zlib.error:
+            continue
+
+        _path_out = directory / f"{_offset:#x}.inflated"
+        _length: int | None
+        with _path_out.open("wb") as f_out:
+            try:
+                _length = inflate_at(
+                    data,
+                    _offset,
+                    _fmt,
+                    f_out,
+                    block_size,
+                    OutputLimit(max_size, max_ratio),
+                )
+            except InflateLimitError as err:
+                logger.warning(
+                    "Skipping %s stream at %#x: %s", _fmt.value, _offset, err
+                )
+                _length = None
+        if _length is None:
+            _path_out.unlink()
+            continue
+
+        logger.debug("Found %s stream at %#x", _fmt.value, _offset)
+        _pos = _offset + _length  # streams don't overlap
+        yield _offset, _fmt, _length, _path_out
 
 
 @app.command()
@@ -44,18 +247,91 @@ def zlib_inflate(
         dir_okay=False,
         help="Filename for output stream",
     ),
+    block_size: int = typer.Option(
+        DEFAULT_BLOCK_SIZE,
+        "--block-size",
+        "-b",
+        min=1,
+        help="Number of bytes read from the input at a time",
+    ),
+    fmt: Format = typer.Option(
+        Format.AUTO,
+        "--format",
+        "-f",
+        case_sensitive=False,
+        help="Format of the compressed stream, auto detected from its header by default",
+    ),
+    max_size: Optional[int] = typer.Option(
+        None,
+        "--max-size",
+        min=0,
+        help="Abort once the inflated output grows past this many bytes",
+    ),
+    max_ratio: Optional[float] = typer.Option(
+        None,
+        "--max-ratio",
+        min=1,
+        help="Abort once the inflated output grows past this many times the input",
+    ),
+    zdict: Optional[Path] = typer.Option(
+        None,
+        "--zdict",
+        exists=True,
+        readable=True,
+        file_okay=True,
+        dir_okay=False,
+        help="File with the preset dictionary the input was compressed with",
+    ),
+    scan: Optional[Path] = typer.Option(
+        None,
+        "--scan",
+        "-s",
+        file_okay=False,
+        dir_okay=True,
+        writable=True,
+        help="Directory to inflate every zlib or gzip stream embedded anywhere in the "
+        "input to",
+    ),
     version: Optional[bool] = typer.Option(  # pylint: disable=unused-argument
         None, "--version", callback=version_callback, help="Show version info and exit"
     ),
 ):
     """
-    Decompresses (inflates) a zlib compressed file. Defaults to reading from standard
-    in and writing to standard out.
+    Decompresses (inflates) a zlib, gzip or raw deflate compressed file. Defaults to
+    reading from standard in and writing to standard out.
     """
+    if scan is not None:
+        if str(path_out) != "-":
+            raise typer.BadParameter("--scan cannot be combined with --output")
+        _found: int = 0
+        with stream(path_in, "rb") as f_in, map_input(f_in) as data:
+            for _offset, _fmt, _length, _path_out in scan_streams(
+                data, scan, block_size, max_size, max_ratio
+            ):
+                typer.echo(f"{_offset:#x}\t{_fmt.value}\t{_length}\t{_path_out}")
+                _found += 1
+        if not _found:
+            logger.error("No compressed streams found in input")
+            raise typer.Exit(1)
+        return
+
     with stream(path_in, "rb") as f_in, stream(path_out, "wb") as f_out:
-        gen = chunk_generator(f_in)
-        for chunk in gen:
-            f_out.write(chunk)
+        gen = chunk_generator(
+            f_in,
+            block_size,
+            fmt,
+            OutputLimit(max_size, max_ratio),
+            zdict.read_bytes() if zdict is not None else None,
+        )
+        try:
+            for chunk in gen:
+                f_out.write(chunk)
+        except InflateLimitError as err:
+            logger.error("%s, aborting", err)
+            raise typer.Exit(1)  # pylint: disable=raise-missing-from
+        except zlib.error as err:
+            logger.error("Unable to inflate input: %s", err)
+            raise typer.Exit(1)  # pylint: disable=raise-missing-from
 
 
 if __name__ == "__main__":
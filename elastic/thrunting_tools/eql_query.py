@@ -17,20 +17,37 @@
 # specific language governing permissions and limitations
 # under the License.
 
-import json
+import asyncio
 import logging
 import sys
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import typer
 from appdirs import AppDirs
-from rich import print_json
 from scalpl import Cut
 
-from elastic.thrunting_tools.common.elastic import connect_elasticsearch
-from elastic.thrunting_tools.common.settings import ElasticsearchSettings
-from elastic.thrunting_tools.common.utils import choose_config_entry, version_callback
+from elastic.thrunting_tools.common.cache import (
+    DEFAULT_CACHE_TTL,
+    ResultCache,
+    cached_time_range,
+)
+from elastic.thrunting_tools.common.datemath import split_range
+from elastic.thrunting_tools.common.elastic import (
+    connect_elasticsearch,
+    fan_out,
+    tail_events,
+)
+from elastic.thrunting_tools.common.fields import compile_fields, response_filter
+from elastic.thrunting_tools.common.output import print_results
+from elastic.thrunting_tools.common.utils import (
+    choose_config_entry,
+    read_queries,
+    version_callback,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -43,11 +60,23 @@ DEFAULT_INDEX = ".alerts-security.alerts-default,apm-*-transaction*,logs-*"
 
 @app.command()
 def eql_query(
-    query: str = typer.Argument(
-        ...,
+    query: Optional[str] = typer.Argument(
+        None,
         help="Query specified using EQL (See https://ela.st/eql)",
         show_default=False,
     ),
+    queries: Optional[Path] = typer.Option(
+        None,
+        "--queries",
+        "-q",
+        allow_dash=True,
+        readable=True,
+        file_okay=True,
+        dir_okay=False,
+        help="Run a batch of queries from a file (one per line, or a YAML list) "
+        "instead of QUERY. Results are tagged with their query in '_query'",
+        show_default=False,
+    ),
     index: str = typer.Option(
         None,
         "--index",
@@ -70,8 +99,45 @@ def eql_query(
     fields: Optional[str] = typer.Option(
         None, "-f", "--fields", help="Comma separated list of fields to display"
     ),
+    exclude: Optional[str] = typer.Option(
+        None,
+        "-x",
+        "--exclude",
+        help="Comma separated list of fields to leave out of returned documents",
+    ),
     size: Optional[int] = typer.Option(
-        100, "-s", "--size", help="Specify maximum size of result set"
+        100,
+        "-s",
+        "--size",
+        help="Specify maximum size of result set, the latest events of the time range",
+    ),
+    slices: Optional[int] = typer.Option(
+        1,
+        "--slices",
+        min=1,
+        help="Split the time range into this many windows searched in parallel, "
+        "merged in @timestamp order",
+    ),
+    use_async: Optional[bool] = typer.Option(
+        False,
+        "--async",
+        help="Use the asyncio engine, overlapping searches with printing results",
+    ),
+    cache: Optional[bool] = typer.Option(
+        False,
+        "--cache",
+        help="Serve repeated queries from a local cache. Full documents are cached so "
+        "--fields/--compact changes don't hit the cluster. Relative times are rounded "
+        "down to the cache TTL",
+    ),
+    cache_ttl: Optional[int] = typer.Option(
+        DEFAULT_CACHE_TTL, "--cache-ttl", min=1, help="Seconds to keep cached results"
+    ),
+    workers: Optional[int] = typer.Option(
+        4,
+        "--workers",
+        min=1,
+        help="Number of queries from --queries to run concurrently",
     ),
     config: Optional[Path] = typer.Option(
         f"{dirs.user_config_dir}/config.yml",
@@ -92,52 +158,201 @@ def eql_query(
 ) -> None:
     # pylint: disable=missing-function-docstring
 
+    if (query is None) == (queries is None):
+        raise typer.BadParameter("Provide either QUERY or --queries, but not both")
+    if queries is not None and slices > 1:
+        raise typer.BadParameter("--slices cannot be combined with --queries")
+    if cache and queries is not None:
+        raise typer.BadParameter("--cache cannot be combined with --queries")
+
     _cfg_dict: Dict[str, Any] = {"default_index": DEFAULT_INDEX}
     _local: Dict[str, Any] = choose_config_entry(config, "elasticsearch", environment)
     if _local:
         _cfg_dict |= _local
 
+    # pydantic and the Elasticsearch client are only loaded once a query is run
+    # pylint: disable=import-outside-toplevel
+    from elastic.thrunting_tools.common.settings import ElasticsearchSettings
+
     _cfg = ElasticsearchSettings(**_cfg_dict)
     if index is None:
         index = _cfg.default_index
 
-    logger.info("Creating es client")
-    esclient = connect_elasticsearch(_cfg)
-    _filter = {"range": {"@timestamp": {"gte": since, "lt": before}}}
-
     field_view: List[str] = []
     if fields is not None:
         field_view = fields.split(",")
 
-    _results = Cut(
-        esclient.eql.search(
+    exclude_view: List[str] = []
+    if exclude is not None:
+        exclude_view = exclude.split(",")
+
+    _project: Callable[[Dict[str, Any]], Dict[str, Any]] = lambda event: event
+    if field_view:
+        _project = compile_fields(field_view)
+
+    _cache: ResultCache | None = None
+    _cache_key: str = ""
+    if cache:
+        # Pin the time range so the results match the cache key
+        try:
+            since, before = cached_time_range(since, before, cache_ttl)
+        except ValueError as err:
+            raise typer.BadParameter(str(err))  # pylint: disable=raise-missing-from
+        _cache = ResultCache(Path(dirs.user_cache_dir) / "results", ttl=cache_ttl)
+        _cache_key = ResultCache.key(
+            tool="eql-query",
+            environment=environment,
             index=index,
             query=query,
-            filter=_filter,
-            fields=field_view,
+            since=since,
+            before=before,
             size=size,
+            by_timestamp=slices > 1,
+            exclude=exclude_view,
         )
+
+        _cached = _cache.get(_cache_key)
+        if _cached is not None:
+            print_results(map(_project, _cached), compact)
+            return
+
+    # Only fetch the fields we're going to display, unless caching whole documents
+    _source_kwargs = response_filter(
+        "hits.events", None if cache else field_view, exclude_view
     )
 
-    logger.info("Found %s results", _results["hits.total.value"])
+    _windows: List[Tuple[str, str]] = [(since, before)]
+    if slices > 1:
+        try:
+            _windows = split_range(since, before, slices)
+        except ValueError as err:
+            raise typer.BadParameter(str(err))  # pylint: disable=raise-missing-from
+
+    _batch: List[str] = []
+    if queries is not None:
+        _batch = read_queries(queries)
+        logger.info("Running %s queries", len(_batch))
 
-    indent: Optional[int] = None
-    if not compact:
-        indent = 4
+    def _request(_query: str, _since: str, _before: str) -> Dict[str, Any]:
+        return {
+            "index": index,
+            "query": _query,
+            "filter": {"range": {"@timestamp": {"gte": _since, "lt": _before}}},
+            **_source_kwargs,
+            "size": size,
+            # The latest events, also when --slices merges windows with tail_events
+            "result_position": "tail",
+        }
 
-    for item in _results["hits.events"]:
-        _view: Cut = Cut({})
-        item = Cut(item)
+    def _events_of(_response: Dict[str, Any]) -> List[Dict[str, Any]]:
+        _results = Cut(_response)
+        logger.info("Found %s results", _results["hits.total.value"])
+        return _results.get("hits.events", [])
 
-        if field_view is not None and len(field_view) > 0:
-            for _field in field_view:
-                if item.get(f"_source.{_field}", None) is not None:
-                    _view.setdefault(_field, item[f"_source.{_field}"])
-        else:
-            _view = item
+    _recorded: List[Dict[str, Any]] = []
+    _complete: bool = True
+
+    def _write(_events: Iterable[Dict[str, Any]]) -> bool:
+        nonlocal _complete
+        if _cache is not None:
+            _events = list(_events)
+            _recorded.extend(_events)
+        _complete = print_results(map(_project, _events), compact) and _complete
+        return _complete
+
+    def _store() -> None:
+        if _cache is not None and _complete:
+            _cache.put(_cache_key, _recorded)
+
+    def _write_tagged(_tagged: Tuple[str, List[Dict[str, Any]]]) -> bool:
+        _query, _events = _tagged
+        return print_results(
+            ({**_project(_event), "_query": _query} for _event in _events), compact
+        )
+
+    async def _run_async() -> None:
+        from elasticsearch import ApiError
+
+        from elastic.thrunting_tools.common.async_elastic import (
+            connect_async_elasticsearch,
+            ordered,
+            tag_pages,
+            write_pages,
+        )
+
+        _es = await connect_async_elasticsearch(_cfg)
+
+        async def _search(
+            _query: str, _since: str, _before: str
+        ) -> List[Dict[str, Any]]:
+            return _events_of(await _es.eql.search(**_request(_query, _since, _before)))
+
+        async def _search_batch(_query: str) -> List[Dict[str, Any]]:
+            try:
+                return await _search(_query, since, before)
+            except ApiError as err:
+                logger.error("Search failed for '%s': %s", _query, err)
+                return []
+
+        try:
+            if queries is not None:
+                _searches = [partial(_search_batch, _query) for _query in _batch]
+                await write_pages(
+                    tag_pages(_batch, ordered(_searches, workers)), _write_tagged
+                )
+            else:
+                _searches = [
+                    partial(_search, query, *_window) for _window in _windows[::-1]
+                ]
+                _write(tail_events([_page async for _page in ordered(_searches)], size))
+        finally:
+            await _es.close()
+
+    if use_async:
+        asyncio.run(_run_async())
+        _store()
+        return
+
+    logger.info("Creating es client")
+    esclient = connect_elasticsearch(_cfg)
+
+    def _search(_query: str, _since: str, _before: str) -> List[Dict[str, Any]]:
+        return _events_of(esclient.eql.search(**_request(_query, _since, _before)))
+
+    if queries is not None:
+        from elasticsearch import ApiError
+
+        # One bad query is logged and yields no events, it doesn't sink the batch
+        def _search_batch(_query: str) -> List[Dict[str, Any]]:
+            try:
+                return _search(_query, since, before)
+            except ApiError as err:
+                logger.error("Search failed for '%s': %s", _query, err)
+                return []
+
+        _pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            _futures = [_pool.submit(_search_batch, _query) for _query in _batch]
+            for _query, _future in zip(_batch, _futures):
+                if not _write_tagged((_query, _future.result())):
+                    break
+        finally:
+            # Don't wait for queued queries once the output is closed
+            _pool.shutdown(cancel_futures=True)
+        return
+
+    _events: Iterable[Dict[str, Any]]
+    if slices > 1:
+        # Newest window first, each window's events come back as a single page
+        _events = tail_events(
+            fan_out(lambda *_window: [_search(query, *_window)], _windows[::-1]),
+            size,
+        )
+    else:
+        _events = _search(query, since, before)
 
-        _json = json.dumps(dict(_view)).strip()
-        print_json(_json, indent=indent, sort_keys=True)
+    _write(_events)
+    _store()
 
 
 if __name__ == "__main__":
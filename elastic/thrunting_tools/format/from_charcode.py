@@ -1,34 +1,181 @@
 #!/usr/bin/env python3
-import sys
+import re
 from pathlib import Path
-from typing import Optional, TextIO
+from typing import Dict, Iterator, List, Optional, TextIO
 
 import typer
 
-from elastic.thrunting_tools.common.utils import version_callback
+from elastic.thrunting_tools.common.utils import stream, version_callback
 
-MAX_BLOCK_SIZE: int = 4096
+MAX_BLOCK_SIZE: int = 64 * 1024
+# Longer tokens can't be a valid code in any base, and aren't carried between blocks
+MAX_TOKEN_LENGTH: int = 64
+MAX_TABLE_SIZE: int = 64 * 1024
+# Longer than any encoded character but a String.fromCharCode call (at most 22 chars,
+# e.g. "[char]" with 8 spaces and "0x10ffff"), so a match that starts before the last
+# DIALECT_TAIL characters of a block is always complete
+DIALECT_TAIL: int = 32
+MAX_CALL_LENGTH: int = 64 * 1024
+DIALECTS = re.compile(
+    r"String\.fromCharCode\((?P<call>[\s0-9a-fA-FxX,]*)\)"
+    r"|(?i:\[char\])\s{0,8}(?:0[xX](?P<char_hex>[0-9a-fA-F]{1,6})|(?P<char>\d{1,7}))"
+    r"|\\x(?P<x>[0-9a-fA-F]{2})"
+    r"|\\u\{(?P<u_brace>[0-9a-fA-F]{1,6})\}"
+    r"|\\u(?P<u>[0-9a-fA-F]{4})"
+    r"|&#[xX](?P<entity_hex>[0-9a-fA-F]{1,6});?"
+    r"|&#(?P<entity>\d{1,7});?"
+    r"|%u(?P<percent_u>[0-9a-fA-F]{4})"
+)
+UNTERMINATED_CALL = re.compile(r"String\.fromCharCode\([\s0-9a-fA-FxX,]*\Z")
+SURROGATE = re.compile("[\ud800-\udfff]")
+DIALECT_BASES: Dict[str, int] = {
+    "char_hex": 16,
+    "char": 10,
+    "x": 16,
+    "u_brace": 16,
+    "u": 16,
+    "entity_hex": 16,
+    "entity": 10,
+    "percent_u": 16,
+}
 
 
 app = typer.Typer(add_completion=False)
 
 
-def chunk_generator(stream: TextIO, delimiter: str) -> str:
-    _buffer: str = ""
+def chunk_generator(
+    stream_in: TextIO, block_size: int = MAX_BLOCK_SIZE
+) -> Iterator[str]:
     while True:  # Loop until EOF
-        _chunk = stream.read(MAX_BLOCK_SIZE)
+        _chunk = stream_in.read(block_size)
         if not _chunk:
-            yield _buffer
             break
 
-        _buffer += _chunk
-        while True:
-            _part, _, _buffer = _buffer.partition(delimiter)
-            if _ != delimiter:  # no more delimiters
-                _buffer = _part
+        yield _chunk
+
+
+class TokenTable(dict):
+    """
+    Memoized conversion of tokens to the character they encode in a base. Tokens that
+    aren't a valid code convert to an empty string.
+    """
+
+    def __init__(self, base: int):
+        super().__init__()
+        self.base = base
+
+    def __missing__(self, token: str) -> str:
+        _code = token.strip()
+        _chr: str = ""
+        if _code.isalnum():
+            try:
+                _chr = chr(int(_code, self.base))
+            except (ValueError, OverflowError):
+                pass
+
+        if len(self) >= MAX_TABLE_SIZE:  # only junk has that many distinct tokens
+            self.clear()
+        self[token] = _chr
+        return _chr
+
+
+def decode_blocks(blocks: Iterator[str], delimiter: str, base: int) -> Iterator[str]:
+    """
+    Decodes blocks of delimited character codes, as one string per block. Each block is
+    split in one go, and the partial token at its end is carried over to the next.
+    """
+    _table = TokenTable(base)
+    _carry: str = ""
+    _overflow: bool = False  # the carried token was cut short, so it isn't valid
+    for _block in blocks:
+        _tokens = (_carry + _block).split(delimiter)
+        _carry = _tokens.pop()
+        if _overflow and _tokens:
+            _tokens[0] = ""
+            _overflow = False
+        if len(_carry) > MAX_TOKEN_LENGTH:
+            # Keep enough to spot a delimiter that straddles the next block
+            _carry = _carry[len(_carry) - len(delimiter) + 1 :]
+            _overflow = True
+
+        yield "".join(map(_table.__getitem__, _tokens))
+
+    if not _overflow:
+        yield _table[_carry]
+
+
+def _decode_dialect(match: re.Match) -> str:
+    try:
+        if match.lastgroup == "call":
+            return "".join(
+                chr(int(_arg, 16 if _arg[:2] in ("0x", "0X") else 10))
+                for _arg in map(str.strip, match.group("call").split(","))
+                if _arg
+            )
+        return chr(int(match.group(match.lastgroup), DIALECT_BASES[match.lastgroup]))
+    except (ValueError, OverflowError):  # not a valid code, leave it as is
+        return match.group()
+
+
+def decode_dialects(blocks: Iterator[str]) -> Iterator[str]:
+    """
+    Decodes every character code written as `String.fromCharCode(...)`, `[char]0x41`,
+    `\\x41`, `\\u0041`, `\\u{41}`, `&#65;`, `&#x41;` or `%u0041` in blocks of text, in
+    one pass with a single regular expression. Everything else is passed through as is.
+    The end of each block is carried over to the next, in case it holds the start of an
+    encoded character.
+    """
+    _cache: Dict[str, str] = {}
+    _carry: str = ""
+    _surrogate: str = ""
+    _blocks = iter(blocks)
+    while True:
+        _block: str | None = next(_blocks, None)
+        _text = _carry + (_block or "")
+        if not _text and not _surrogate:
+            break
+
+        _cut: int = len(_text)
+        if _block is not None:
+            _cut = max(len(_text) - DIALECT_TAIL, 0)
+            _call = UNTERMINATED_CALL.search(
+                _text, max(len(_text) - MAX_CALL_LENGTH, 0)
+            )
+            if _call is not None:
+                _cut = min(_cut, _call.start())
+
+        _pieces: List[str] = []
+        _pos: int = 0
+        for _match in DIALECTS.finditer(_text):
+            if _match.start() >= _cut:
                 break
-            else:
-                yield _part
+            _pieces.append(_text[_pos : _match.start()])
+            _code = _match.group()
+            _decoded = _cache.get(_code)
+            if _decoded is None:
+                if len(_cache) >= MAX_TABLE_SIZE:
+                    _cache.clear()
+                _decoded = _cache[_code] = _decode_dialect(_match)
+            _pieces.append(_decoded)
+            _pos = _match.end()
+
+        _end = max(_pos, _cut)
+        _pieces.append(_text[_pos:_end])
+        _carry = _text[_end:]
+
+        _decoded_block = _surrogate + "".join(_pieces)
+        _surrogate = ""
+        if SURROGATE.search(_decoded_block):  # UTF-16 pairs, e.g. \\ud83e\\udd8c
+            if _block is not None and "\ud800" <= _decoded_block[-1] <= "\udbff":
+                # The low half of the pair may still be on its way
+                _decoded_block, _surrogate = _decoded_block[:-1], _decoded_block[-1]
+            _decoded_block = _decoded_block.encode("utf-16-le", "surrogatepass").decode(
+                "utf-16-le", "replace"
+            )
+        yield _decoded_block
+
+        if _block is None:
+            break
 
 
 def validate_base(value: int):
@@ -37,6 +184,12 @@ def validate_base(value: int):
     return value
 
 
+def validate_delimiter(value: str):
+    if not value:
+        raise typer.BadParameter("Delimiter must not be empty")
+    return value
+
+
 @app.command()
 def from_charcode(
     path_in: Path = typer.Option(
@@ -59,17 +212,29 @@ def from_charcode(
         dir_okay=False,
         help="Filename for output stream",
     ),
-    delimiter: Optional[str] = typer.Option(" ", "--delimiter", "-d"),
+    delimiter: Optional[str] = typer.Option(
+        " ", "--delimiter", "-d", callback=validate_delimiter
+    ),
     base: Optional[int] = typer.Option(16, "--base", "-b", callback=validate_base),
+    auto: bool = typer.Option(
+        False,
+        "--auto",
+        "-a",
+        help="Decode String.fromCharCode(...), \\[char]0x41, \\x41, \\u0041, &#65;, &#x41; "
+        "and %u0041 wherever they appear, passing other text through. Ignores "
+        "--delimiter and --base",
+    ),
     version: Optional[bool] = typer.Option(  # pylint: disable=unused-argument
         None, "--version", callback=version_callback, help="Show version info and exit"
     ),
 ):
-    f_in = sys.stdin if str(path_in) == "-" else path_in.open("r")
-    f_out = sys.stdout if str(path_out) == "-" else path_out.open("w")
-    for code in chunk_generator(f_in, delimiter):
-        if code.isalnum():
-            f_out.write(chr(int(code, base)))
+    with stream(path_in, "r") as f_in, stream(path_out, "w") as f_out:
+        if auto:
+            _decoded = decode_dialects(chunk_generator(f_in))
+        else:
+            _decoded = decode_blocks(chunk_generator(f_in), delimiter, base)
+        for _text in _decoded:
+            f_out.write(_text)
 
 
 if __name__ == "__main__":
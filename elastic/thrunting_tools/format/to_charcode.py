@@ -1,20 +1,23 @@
 #!/usr/bin/env python3
+import codecs
 import string
-import sys
 from pathlib import Path
-from typing import Optional, TextIO
+from typing import Dict, Iterator, Optional, Set, TextIO
 
 import typer
 
-from elastic.thrunting_tools.common.utils import version_callback
+from elastic.thrunting_tools.common.utils import stream, version_callback
 
 ALPHABET: str = string.digits + string.ascii_letters
-MAX_CHUNK_SIZE: int = 4096
+MAX_CHUNK_SIZE: int = 64 * 1024
 
 app = typer.Typer(add_completion=False)
 
 
 def int2base(value: int, base: int) -> str:
+    if not value:
+        return ALPHABET[0]
+
     _digits: list[str] = []
     while value:
         _digits.append(ALPHABET[value % base])
@@ -25,13 +28,39 @@ def int2base(value: int, base: int) -> str:
     return "".join(_digits)
 
 
-def chunk_generator(stream: TextIO) -> str:
-    for _chunk in stream:
+def chunk_generator(
+    stream_in: TextIO, block_size: int = MAX_CHUNK_SIZE
+) -> Iterator[str]:
+    while True:  # Loop until EOF
+        _chunk = stream_in.read(block_size)
         if not _chunk:
             break
 
-        for _chr in _chunk:
-            yield _chr
+        yield _chunk
+
+
+def encode_blocks(blocks: Iterator[str], base: int, delimiter: str) -> Iterator[bytes]:
+    """
+    Converts blocks of text to delimited character codes, as one bytes object per
+    block. The code of each codepoint is computed once, the first time it is seen, into
+    a table that the charmap codec applies to the whole block in C.
+    """
+    _prefix: bytes = delimiter.encode("utf-8")
+    _table: Dict[int, bytes] = {}
+    _seen: Set[str] = set()
+    _first: bool = True
+    for _block in blocks:
+        _new = set(_block)
+        _new.difference_update(_seen)
+        for _chr in _new:
+            _table[ord(_chr)] = _prefix + int2base(ord(_chr), base).encode("ascii")
+        _seen.update(_new)
+
+        _codes: bytes = codecs.charmap_encode(_block, "strict", _table)[0]
+        if _first and _codes:
+            _codes = _codes[len(_prefix) :]  # no delimiter before the first code
+            _first = False
+        yield _codes
 
 
 def validate_base(value: int):
@@ -68,15 +97,9 @@ def to_charcode(
         None, "--version", callback=version_callback, help="Show version info and exit"
     ),
 ):
-    f_in = sys.stdin if str(path_in) == "-" else path_in.open("r")
-    f_out = sys.stdout if str(path_out) == "-" else path_out.open("w")
-    first: bool = True
-    for _chr in chunk_generator(f_in):
-        if first:
-            first = False
-        else:
-            f_out.write(delimiter)
-        f_out.write(int2base(ord(_chr), base))
+    with stream(path_in, "r") as f_in, stream(path_out, "wb") as f_out:
+        for _codes in encode_blocks(chunk_generator(f_in), base, delimiter):
+            f_out.write(_codes)
 
 
 if __name__ == "__main__":
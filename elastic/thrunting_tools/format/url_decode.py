@@ -1,28 +1,114 @@
 #!/usr/bin/env python3
-import sys
-import urllib.parse
+import codecs
+import re
 from pathlib import Path
-from typing import Optional, TextIO
+from typing import BinaryIO, Iterator, List, Optional
 
 import typer
 
-from elastic.thrunting_tools.common.utils import version_callback
+from elastic.thrunting_tools.common.utils import stream, version_callback
 
-MAX_BLOCK_SIZE: int = 4096
+DEFAULT_BLOCK_SIZE: int = 1024 * 1024
+ESCAPE = re.compile(rb"%(?=[0-9A-Fa-f]{2})")
 
 app = typer.Typer(add_completion=False)
 
 
-def block_generator(stream: TextIO) -> str:
-    _block: str = ""
+def block_generator(
+    stream_in: BinaryIO, block_size: int = DEFAULT_BLOCK_SIZE
+) -> Iterator[bytes]:
     while True:  # Loop until EOF
-        _block = stream.read(MAX_BLOCK_SIZE)
+        _block = stream_in.read(block_size)
         if not _block:
             break
 
         yield _block
 
 
+def unquote(data: bytes) -> bytes:
+    """
+    Decodes every `%XX` escape in data, like `urllib.parse.unquote_to_bytes`. The
+    escapes are rewritten as `\\xXX` and decoded by `codecs.escape_decode` in C, rather
+    than one at a time in Python.
+    """
+    if b"%" not in data:
+        return data
+    if b"\\" in data:
+        data = data.replace(b"\\", b"\\\\")
+    try:
+        return codecs.escape_decode(data.replace(b"%", b"\\x"))[0]
+    except ValueError:  # some % isn't an escape, only rewrite those that are
+        return codecs.escape_decode(ESCAPE.sub(rb"\\x", data))[0]
+
+
+class Unquoter:
+    """
+    Decodes a stream of bytes fed in blocks. An escape split between two blocks (i.e.
+    a `%` in the last two bytes of a block) is carried over to the next one. `changed`
+    records whether any escape has been decoded so far.
+    """
+
+    def __init__(self, plus: bool = False):
+        self.plus = plus
+        self.changed: bool = False
+        self._carry: bytes = b""
+
+    def feed(self, data: bytes, final: bool = False) -> bytes:
+        """Decodes the next block, or whatever is left over if `final`"""
+        data = self._carry + data
+        self._carry = b""
+        if not final:
+            _cut = data.find(b"%", len(data) - 2)
+            if _cut >= 0:
+                data, self._carry = data[:_cut], data[_cut:]
+
+        if self.plus:
+            data = data.replace(b"+", b" ")
+        _decoded = unquote(data)
+        self.changed = self.changed or len(_decoded) < len(data)
+        return _decoded
+
+
+def decode_blocks(
+    blocks: Iterator[bytes], plus: bool = False, recursive: bool = False
+) -> Iterator[bytes]:
+    """
+    Decodes a URL encoded stream of bytes, block by block. Multi-byte UTF-8 sequences
+    are left as bytes, so they survive being split between blocks. With `recursive`,
+    the output is decoded again for as long as decoding changes it, for payloads that
+    were encoded several times. Another stage is only added to the chain once the
+    last one has decoded something. Until then, a `%` or `%X` at the end of the output
+    of the last stage is held back, as a character it decodes later may complete it.
+    """
+    _stages: List[Unquoter] = [Unquoter(plus)]
+    _held: bytes = b""
+
+    def _feed(data: bytes, final: bool) -> bytes:
+        nonlocal _held
+        _idx: int = 0
+        while _idx < len(_stages):  # the chain can grow as it's walked
+            data = _stages[_idx].feed(data, final)
+            if recursive and _idx == len(_stages) - 1:
+                data, _held = _held + data, b""
+                if _stages[_idx].changed:
+                    _stages.append(Unquoter(plus))
+                elif not final:
+                    _cut = data.find(b"%", len(data) - 2)
+                    if _cut >= 0:
+                        data, _held = data[:_cut], data[_cut:]
+            _idx += 1
+        return data
+
+    for _block in blocks:
+        _decoded = _feed(_block, False)
+        if _decoded:
+            yield _decoded
+
+    _decoded = _feed(b"", True)
+    if _decoded:
+        yield _decoded
+
+
 @app.command()
 def url_decode(
     path_in: Path = typer.Option(
@@ -45,14 +131,31 @@ def url_decode(
         dir_okay=False,
         help="Filename for output stream",
     ),
+    block_size: int = typer.Option(
+        DEFAULT_BLOCK_SIZE,
+        "--block-size",
+        "-b",
+        min=1,
+        help="Number of bytes read from the input at a time",
+    ),
+    plus: bool = typer.Option(
+        False, "--plus", "-p", help="Decode '+' as a space, like form data"
+    ),
+    recursive: bool = typer.Option(
+        False,
+        "--recursive",
+        "-r",
+        help="Keep decoding until nothing changes, for payloads encoded several times",
+    ),
     version: Optional[bool] = typer.Option(  # pylint: disable=unused-argument
         None, "--version", callback=version_callback, help="Show version info and exit"
     ),
 ):
-    f_in = sys.stdin if str(path_in) == "-" else path_in.open("r")
-    f_out = sys.stdout if str(path_out) == "-" else path_out.open("w")
-    for block in block_generator(f_in):
-        f_out.write(urllib.parse.unquote(block))
+    with stream(path_in, "rb") as f_in, stream(path_out, "wb") as f_out:
+        for _decoded in decode_blocks(
+            block_generator(f_in, block_size), plus, recursive
+        ):
+            f_out.write(_decoded)
 
 
 if __name__ == "__main__":
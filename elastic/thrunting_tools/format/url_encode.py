@@ -1,35 +1,80 @@
 #!/usr/bin/env python3
-import sys
-import urllib.parse
+import string
 from pathlib import Path
-from typing import Optional, TextIO
+from typing import BinaryIO, Iterator, Optional, Tuple
 
 import typer
 
-from elastic.thrunting_tools.common.utils import version_callback
+from elastic.thrunting_tools.common.utils import stream, version_callback
 
-MAX_BLOCK_SIZE: int = 4096
+DEFAULT_BLOCK_SIZE: int = 1024 * 1024
+# Never encoded, like urllib.parse.quote
+ALWAYS_SAFE: bytes = (string.ascii_letters + string.digits).encode("ascii")
+# Only encoded with --all
+UNRESERVED: bytes = b"_.-~"
+DEFAULT_SAFE: str = "/"
+PADDING: bytes = b"\0"
 
 app = typer.Typer(add_completion=False)
 
+EscapeTables = Tuple[bytes, bytes, bytes]
 
-def block_generator(stream: TextIO) -> str:
-    _block: str = ""
+
+def block_generator(
+    stream_in: BinaryIO, block_size: int = DEFAULT_BLOCK_SIZE
+) -> Iterator[bytes]:
     while True:  # Loop until EOF
-        _block = stream.read(MAX_BLOCK_SIZE)
+        _block = stream_in.read(block_size)
         if not _block:
             break
 
         yield _block
 
 
-def quote_all(block: str) -> str:
-    retval: str = urllib.parse.quote(block, safe="")
-    retval = retval.replace("_", "%5F")
-    retval = retval.replace(".", "%2E")
-    retval = retval.replace("-", "%2D")
-    retval = retval.replace("~", "%7E")
-    return retval
+def escape_tables(safe: bytes) -> EscapeTables:
+    """
+    Precomputes the escape of every byte value, i.e. `%XX`, or the byte itself padded
+    with two NUL bytes if it is safe. The escapes are split into three `bytes.translate`
+    tables, one per character of the escape.
+    """
+    _escapes = [
+        bytes((_byte,)) + PADDING * 2 if _byte in safe else b"%%%02X" % _byte
+        for _byte in range(256)
+    ]
+    return (
+        bytes(_escape[0] for _escape in _escapes),
+        bytes(_escape[1] for _escape in _escapes),
+        bytes(_escape[2] for _escape in _escapes),
+    )
+
+
+def quote(data: bytes, tables: EscapeTables) -> bytes:
+    """
+    URL encodes data in a few passes in C: each table is applied to the whole of data,
+    the results are interleaved, then the padding is dropped. A NUL byte is never safe,
+    so the padding can't be mistaken for input.
+    """
+    _escaped = bytearray(3 * len(data))
+    for _idx, _table in enumerate(tables):
+        _escaped[_idx::3] = data.translate(_table)
+    return bytes(_escaped.translate(None, PADDING))
+
+
+def quote_blocks(blocks: Iterator[bytes], safe: bytes) -> Iterator[bytes]:
+    """URL encodes every byte that isn't a letter, a digit or in `safe`"""
+    _safe = (ALWAYS_SAFE + safe).replace(PADDING, b"")
+    _tables = escape_tables(_safe)
+    for _block in blocks:
+        if not _block.translate(None, _safe):  # nothing to encode
+            yield _block
+        else:
+            yield quote(_block, _tables)
+
+
+def validate_safe(value: Optional[str]):
+    if value is not None and not value.isascii():
+        raise typer.BadParameter("Safe characters must be ASCII")
+    return value
 
 
 @app.command()
@@ -57,20 +102,32 @@ def url_encode(
     encode_all: bool = typer.Option(
         False, "--all", help="Encode all special characters"
     ),
+    safe: Optional[str] = typer.Option(
+        None,
+        "--safe",
+        "-s",
+        callback=validate_safe,
+        help=f"Special characters to leave as they are [default: '{DEFAULT_SAFE}', or "
+        "none with --all]",
+    ),
+    block_size: int = typer.Option(
+        DEFAULT_BLOCK_SIZE,
+        "--block-size",
+        "-b",
+        min=1,
+        help="Number of bytes read from the input at a time",
+    ),
     version: Optional[bool] = typer.Option(  # pylint: disable=unused-argument
         None, "--version", callback=version_callback, help="Show version info and exit"
     ),
 ):
+    if safe is None:
+        safe = "" if encode_all else DEFAULT_SAFE
+    _safe = safe.encode("ascii") if encode_all else UNRESERVED + safe.encode("ascii")
 
-    f_in = sys.stdin if str(path_in) == "-" else path_in.open("r")
-    f_out = sys.stdout if str(path_out) == "-" else path_out.open("w")
-    if not encode_all:
-        _quote = urllib.parse.quote
-    else:
-        _quote = quote_all
-
-    for block in block_generator(f_in):
-        f_out.write(_quote(block))
+    with stream(path_in, "rb") as f_in, stream(path_out, "wb") as f_out:
+        for _quoted in quote_blocks(block_generator(f_in, block_size), _safe):
+            f_out.write(_quoted)
 
 
 if __name__ == "__main__":
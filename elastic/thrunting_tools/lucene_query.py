@@ -17,20 +17,39 @@
 # specific language governing permissions and limitations
 # under the License.
 
-import json
+import asyncio
 import logging
 import sys
+from collections.abc import AsyncIterator, Callable
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 import typer
 from appdirs import AppDirs
-from rich import print_json
-from scalpl import Cut
 
-from elastic.thrunting_tools.common.elastic import connect_elasticsearch
-from elastic.thrunting_tools.common.settings import ElasticsearchSettings
-from elastic.thrunting_tools.common.utils import choose_config_entry, version_callback
+from elastic.thrunting_tools.common.cache import (
+    DEFAULT_CACHE_TTL,
+    ResultCache,
+    cached_time_range,
+)
+from elastic.thrunting_tools.common.datemath import split_range
+from elastic.thrunting_tools.common.elastic import (
+    DEFAULT_PAGE_SIZE,
+    LATEST_SORT,
+    connect_elasticsearch,
+    fan_out,
+    msearch_hits,
+    search_after_hits,
+    tail_events,
+)
+from elastic.thrunting_tools.common.fields import compile_fields, source_filter
+from elastic.thrunting_tools.common.output import print_results
+from elastic.thrunting_tools.common.utils import (
+    choose_config_entry,
+    read_queries,
+    version_callback,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -41,13 +60,44 @@ dirs = AppDirs(appname="thrunting-tools", appauthor="elastic")
 DEFAULT_INDEX = "logs-*,metrics-*"
 
 
+def build_query(query: str, since: str, before: str) -> Dict[str, Any]:
+    """Wraps a Lucene query string in a bool query filtered to a time range"""
+    _filter = {"range": {"@timestamp": {"gte": since, "lt": before}}}
+    return {
+        "bool": {
+            "must": [
+                {
+                    "query_string": {
+                        "query": query,
+                        "analyze_wildcard": True,
+                        "allow_leading_wildcard": True,
+                    }
+                }
+            ],
+            "filter": [_filter],
+        }
+    }
+
+
 @app.command()
 def lucene_query(
-    query: str = typer.Argument(
-        ...,
+    query: Optional[str] = typer.Argument(
+        None,
         help="Query specified using Lucene (See https://ela.st/lucene)",
         show_default=False,
     ),
+    queries: Optional[Path] = typer.Option(
+        None,
+        "--queries",
+        "-q",
+        allow_dash=True,
+        readable=True,
+        file_okay=True,
+        dir_okay=False,
+        help="Run a batch of queries from a file (one per line, or a YAML list) "
+        "instead of QUERY. Results are tagged with their query in '_query'",
+        show_default=False,
+    ),
     index: str = typer.Option(
         None,
         "--index",
@@ -70,8 +120,51 @@ def lucene_query(
     fields: Optional[str] = typer.Option(
         None, "-f", "--fields", help="Comma separated list of fields to display"
     ),
+    exclude: Optional[str] = typer.Option(
+        None,
+        "-x",
+        "--exclude",
+        help="Comma separated list of fields to leave out of returned documents",
+    ),
     size: Optional[int] = typer.Option(
-        100, "-s", "--size", help="Specify maximum size of result set"
+        100,
+        "-s",
+        "--size",
+        help="Specify maximum size of result set, the latest hits of the time range",
+    ),
+    all_hits: Optional[bool] = typer.Option(
+        False,
+        "-a",
+        "--all",
+        help="Stream every matching hit using point-in-time pagination, ignoring --size",
+    ),
+    page_size: Optional[int] = typer.Option(
+        DEFAULT_PAGE_SIZE,
+        "--page-size",
+        min=1,
+        help="Number of hits fetched per request when streaming with --all",
+    ),
+    slices: Optional[int] = typer.Option(
+        1,
+        "--slices",
+        min=1,
+        help="Split the time range (or the point-in-time with --all) into this many "
+        "slices searched in parallel, merged in @timestamp order",
+    ),
+    use_async: Optional[bool] = typer.Option(
+        False,
+        "--async",
+        help="Use the asyncio engine, fetching the next page while printing results",
+    ),
+    cache: Optional[bool] = typer.Option(
+        False,
+        "--cache",
+        help="Serve repeated queries from a local cache. Full documents are cached so "
+        "--fields/--compact changes don't hit the cluster. Relative times are rounded "
+        "down to the cache TTL",
+    ),
+    cache_ttl: Optional[int] = typer.Option(
+        DEFAULT_CACHE_TTL, "--cache-ttl", min=1, help="Seconds to keep cached results"
     ),
     config: Optional[Path] = typer.Option(
         f"{dirs.user_config_dir}/config.yml",
@@ -92,60 +185,205 @@ def lucene_query(
 ):
     # pylint: disable=missing-function-docstring
 
+    if (query is None) == (queries is None):
+        raise typer.BadParameter("Provide either QUERY or --queries, but not both")
+    if queries is not None and slices > 1:
+        raise typer.BadParameter("--slices cannot be combined with --queries")
+    if queries is not None and all_hits:
+        raise typer.BadParameter("--all cannot be combined with --queries")
+    if cache and (queries is not None or all_hits):
+        raise typer.BadParameter("--cache cannot be combined with --queries or --all")
+
     _cfg_dict: Dict[str, Any] = {"default_index": DEFAULT_INDEX}
     _local: Dict[str, Any] = choose_config_entry(config, "elasticsearch", environment)
     if _local:
         _cfg_dict |= _local
 
+    # pydantic and the Elasticsearch client are only loaded once a query is run
+    # pylint: disable=import-outside-toplevel
+    from elastic.thrunting_tools.common.settings import ElasticsearchSettings
+
     _cfg = ElasticsearchSettings(**_cfg_dict)
     if index is None:
         index = _cfg.default_index
 
-    logger.info("Creating es client")
-    esclient = connect_elasticsearch(_cfg)
-    _filter = {"range": {"@timestamp": {"gte": since, "lt": before}}}
-    _query = {
-        "bool": {
-            "must": [
-                {
-                    "query_string": {
-                        "query": query,
-                        "analyze_wildcard": True,
-                        "allow_leading_wildcard": True,
-                    }
-                }
-            ],
-            "filter": [_filter],
-        }
-    }
-
-    field_view: List[str] = None
+    field_view: List[str] = []
     if fields is not None:
         field_view = fields.split(",")
 
-    _results = Cut(
-        esclient.search(index=index, query=_query, fields=field_view, size=size)
-    )
+    exclude_view: List[str] = []
+    if exclude is not None:
+        exclude_view = exclude.split(",")
+
+    _project: Callable[[Dict[str, Any]], Dict[str, Any]] = lambda hit: hit
+    if field_view:
+        _project = compile_fields(field_view)
 
-    logger.info("Found %s results", _results["hits.total.value"])
+    _cache: ResultCache | None = None
+    _cache_key: str = ""
+    if cache:
+        # Pin the time range so the results match the cache key
+        try:
+            since, before = cached_time_range(since, before, cache_ttl)
+        except ValueError as err:
+            raise typer.BadParameter(str(err))  # pylint: disable=raise-missing-from
+        _cache = ResultCache(Path(dirs.user_cache_dir) / "results", ttl=cache_ttl)
+        _cache_key = ResultCache.key(
+            tool="lucene-query",
+            environment=environment,
+            index=index,
+            query=query,
+            since=since,
+            before=before,
+            size=size,
+            by_timestamp=slices > 1,
+            exclude=exclude_view,
+        )
+
+        _cached = _cache.get(_cache_key)
+        if _cached is not None:
+            print_results(map(_project, _cached), compact)
+            return
+
+    # Only fetch the fields we're going to display, unless caching whole documents
+    _source_kwargs = source_filter(None if cache else field_view, exclude_view)
+
+    _windows: List[Tuple[str, str]] = [(since, before)]
+    if slices > 1 and not all_hits:
+        try:
+            _windows = split_range(since, before, slices)
+        except ValueError as err:
+            raise typer.BadParameter(str(err))  # pylint: disable=raise-missing-from
+
+    _batch: List[str] = []
+    _bodies: List[Dict[str, Any]] = []
+    if queries is not None:
+        _batch = read_queries(queries)
+        logger.info("Running %s queries", len(_batch))
+        _bodies = [
+            {"query": build_query(_query, since, before), "size": size}
+            for _query in _batch
+        ]
+        if "source" in _source_kwargs:
+            for _body in _bodies:
+                _body["_source"] = _source_kwargs["source"]
+
+    _recorded: List[Dict[str, Any]] = []
+    _complete: bool = True
+
+    def _write(_hits: Iterable[Dict[str, Any]]) -> bool:
+        nonlocal _complete
+        if _cache is not None:
+            _hits = list(_hits)
+            _recorded.extend(_hits)
+        _complete = print_results(map(_project, _hits), compact) and _complete
+        return _complete
+
+    def _store() -> None:
+        if _cache is not None and _complete:
+            _cache.put(_cache_key, _recorded)
+
+    def _write_tagged(_tagged: Tuple[str, List[Dict[str, Any]]]) -> bool:
+        _query, _hits = _tagged
+        return print_results(
+            ({**_project(_hit), "_query": _query} for _hit in _hits), compact
+        )
+
+    async def _run_async() -> None:
+        from elastic.thrunting_tools.common.async_elastic import (
+            connect_async_elasticsearch,
+            msearch_pages,
+            ordered,
+            search_after_pages,
+            tag_pages,
+            write_pages,
+        )
+
+        _es = await connect_async_elasticsearch(_cfg)
+        _pages: AsyncIterator[Any]
+        try:
+            if queries is not None:
+                await write_pages(
+                    tag_pages(_batch, msearch_pages(_es, index, _bodies)),
+                    _write_tagged,
+                )
+                return
+
+            async def _search_window(_since: str, _before: str) -> List[Dict[str, Any]]:
+                _results = await _es.search(
+                    index=index,
+                    query=build_query(query, _since, _before),
+                    **_source_kwargs,
+                    size=size,
+                    sort=LATEST_SORT,
+                )
+                logger.info("Found %s results", _results["hits"]["total"]["value"])
+                return _results["hits"]["hits"][::-1]
+
+            if all_hits:
+                _pages = search_after_pages(
+                    _es,
+                    index,
+                    build_query(query, since, before),
+                    page_size=page_size,
+                    **_source_kwargs,
+                )
+                await write_pages(_pages, _write)
+            else:
+                _searches = [partial(_search_window, *_w) for _w in _windows[::-1]]
+                _write(tail_events([_page async for _page in ordered(_searches)], size))
+        finally:
+            await _es.close()
+
+    if use_async:
+        if all_hits and slices > 1:
+            raise typer.BadParameter("--slices cannot be combined with --all --async")
+        asyncio.run(_run_async())
+        _store()
+        return
+
+    logger.info("Creating es client")
+    esclient = connect_elasticsearch(_cfg)
 
-    indent: Optional[int] = None
-    if not compact:
-        indent = 4
+    if queries is not None:
+        for _tagged in zip(_batch, msearch_hits(esclient, index, _bodies)):
+            if not _write_tagged(_tagged):
+                break
+        return
 
-    for item in _results["hits.hits"]:
-        _view: Cut = Cut({})
-        item = Cut(item)
+    def _search_window(_since: str, _before: str) -> List[Dict[str, Any]]:
+        _results = esclient.search(
+            index=index,
+            query=build_query(query, _since, _before),
+            **_source_kwargs,
+            size=size,
+            sort=LATEST_SORT,
+        )
+        logger.info("Found %s results", _results["hits"]["total"]["value"])
+        # The latest hits come newest first, hand them on in chronological order
+        return _results["hits"]["hits"][::-1]
 
-        if field_view is not None and len(field_view) > 0:
-            for _field in field_view:
-                if item.get(f"_source.{_field}", None) is not None:
-                    _view.setdefault(_field, item[f"_source.{_field}"])
-        else:
-            _view = item
+    _hits: Iterable[Dict[str, Any]]
+    if all_hits:
+        _hits = search_after_hits(
+            esclient,
+            index,
+            build_query(query, since, before),
+            page_size=page_size,
+            slices=slices,
+            **_source_kwargs,
+        )
+    elif slices > 1:
+        # Newest window first, each window's hits come back as a single page
+        _hits = tail_events(
+            fan_out(lambda *_window: [_search_window(*_window)], _windows[::-1]),
+            size,
+        )
+    else:
+        _hits = _search_window(since, before)
 
-        _json = json.dumps(dict(_view)).strip()
-        print_json(_json, indent=indent, sort_keys=True)
+    _write(_hits)
+    _store()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""CLI utility for chaining decoding tools in one process, like a CyberChef recipe"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import codecs
+import io
+import logging
+import zlib
+from collections.abc import Callable, Iterable, Iterator
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import typer
+
+from elastic.thrunting_tools.common.utils import stream, version_callback
+from elastic.thrunting_tools.compression import zlib_deflate, zlib_inflate
+from elastic.thrunting_tools.format import (
+    from_charcode,
+    to_charcode,
+    url_decode,
+    url_encode,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE: int = 1024 * 1024
+DEFAULT_ENCODING: str = "utf-8"
+TRUE_VALUES: Tuple[str, ...] = ("", "1", "true", "yes", "on")
+FALSE_VALUES: Tuple[str, ...] = ("0", "false", "no", "off")
+
+app = typer.Typer(add_completion=False)
+
+Stage = Callable[[Iterator[bytes]], Iterator[bytes]]
+
+
+class GeneratorReader(io.RawIOBase):
+    """
+    Reads the chunks yielded by a stage as a raw binary stream. Chunks are only pulled
+    from the stage as they are read. Like any raw stream, reads can come up short, see
+    `reader` for a stream that behaves like a file.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._pending:
+            _chunk = next(self._chunks, None)
+            if _chunk is None:
+                return 0
+            self._pending = memoryview(_chunk)
+
+        _size = min(len(buffer), len(self._pending))
+        buffer[:_size] = self._pending[:_size]
+        self._pending = self._pending[_size:]
+        return _size
+
+
+def reader(chunks: Iterable[bytes]) -> io.BufferedReader:
+    """
+    Wraps the chunks yielded by a stage in a buffered stream, which fills every read
+    like a file would, so they can be fed to the tools that read their input with
+    `readinto` (e.g. zlib-inflate sniffs the format from the first two bytes).
+    """
+    return io.BufferedReader(GeneratorReader(chunks))
+
+
+def text_blocks(chunks: Iterator[bytes], encoding: str) -> Iterator[str]:
+    """Decodes chunks of bytes to text, including characters split between chunks"""
+    _decoder = codecs.getincrementaldecoder(encoding)("replace")
+    for _chunk in chunks:
+        _text = _decoder.decode(_chunk)
+        if _text:
+            yield _text
+    _text = _decoder.decode(b"", final=True)
+    if _text:
+        yield _text
+
+
+def flag(value: str) -> bool:
+    if value.lower() in TRUE_VALUES:
+        return True
+    if value.lower() in FALSE_VALUES:
+        return False
+    raise ValueError(f"'{value}' is not a boolean")
+
+
+def url_decode_stage(plus: bool = False, recursive: bool = False) -> Stage:
+    return partial(url_decode.decode_blocks, plus=plus, recursive=recursive)
+
+
+def url_encode_stage(encode_all: bool = False, safe: Optional[str] = None) -> Stage:
+    if safe is None:
+        safe = "" if encode_all else url_encode.DEFAULT_SAFE
+    _safe = url_encode.validate_safe(safe).encode("ascii")
+    if not encode_all:
+        _safe = url_encode.UNRESERVED + _safe
+    return partial(url_encode.quote_blocks, safe=_safe)
+
+
+def from_charcode_stage(
+    base: int = 16,
+    delimiter: str = " ",
+    auto: bool = False,
+    encoding: str = DEFAULT_ENCODING,
+) -> Stage:
+    from_charcode.validate_base(base)
+    from_charcode.validate_delimiter(delimiter)
+    codecs.lookup(encoding)
+
+    def _stage(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        _blocks = text_blocks(chunks, DEFAULT_ENCODING)
+        if auto:
+            _decoded = from_charcode.decode_dialects(_blocks)
+        else:
+            _decoded = from_charcode.decode_blocks(_blocks, delimiter, base)
+        for _text in _decoded:
+            yield _text.encode(encoding, "replace")
+
+    return _stage
+
+
+def to_charcode_stage(
+    base: int = 16, delimiter: str = " ", encoding: str = DEFAULT_ENCODING
+) -> Stage:
+    to_charcode.validate_base(base)
+    codecs.lookup(encoding)
+
+    def _stage(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        return to_charcode.encode_blocks(text_blocks(chunks, encoding), base, delimiter)
+
+    return _stage
+
+
+def zlib_inflate_stage(
+    fmt: zlib_inflate.Format = zlib_inflate.Format.AUTO,
+    max_size: Optional[int] = None,
+    max_ratio: Optional[float] = None,
+) -> Stage:
+    def _stage(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        return zlib_inflate.chunk_generator(
+            reader(chunks),
+            DEFAULT_BLOCK_SIZE,
+            fmt,
+            zlib_inflate.OutputLimit(max_size, max_ratio),
+        )
+
+    return _stage
+
+
+def zlib_deflate_stage(
+    level: int = zlib.Z_DEFAULT_COMPRESSION,
+    strategy: zlib_deflate.Strategy = zlib_deflate.Strategy.DEFAULT,
+    wbits: int = zlib.MAX_WBITS,
+) -> Stage:
+    def _stage(chunks: Iterator[bytes]) -> Iterator[bytes]:
+        return zlib_deflate.chunk_generator(
+            reader(chunks), DEFAULT_BLOCK_SIZE, level, strategy, wbits
+        )
+
+    return _stage
+
+
+# Every step of a recipe: the function building the stage, and a parser for each of
+# its options, keyed by the option name used in recipes
+STAGES: Dict[str, Tuple[Callable[..., Stage], Dict[str, Tuple[str, Callable]]]] = {
+    "url-decode": (
+        url_decode_stage,
+        {"plus": ("plus", flag), "recursive": ("recursive", flag)},
+    ),
+    "url-encode": (
+        url_encode_stage,
+        {"all": ("encode_all", flag), "safe": ("safe", str)},
+    ),
+    "from-charcode": (
+        from_charcode_stage,
+        {
+            "base": ("base", int),
+            "delimiter": ("delimiter", str),
+            "auto": ("auto", flag),
+            "encoding": ("encoding", str),
+        },
+    ),
+    "to-charcode": (
+        to_charcode_stage,
+        {
+            "base": ("base", int),
+            "delimiter": ("delimiter", str),
+            "encoding": ("encoding", str),
+        },
+    ),
+    "zlib-inflate": (
+        zlib_inflate_stage,
+        {
+            "format": ("fmt", zlib_inflate.Format),
+            "max-size": ("max_size", int),
+            "max-ratio": ("max_ratio", float),
+        },
+    ),
+    "zlib-deflate": (
+        zlib_deflate_stage,
+        {
+            "level": ("level", int),
+            "strategy": ("strategy", zlib_deflate.Strategy),
+            "wbits": ("wbits", int),
+        },
+    ),
+}
+STAGES["zlib-decompress"] = STAGES["zlib-inflate"]
+STAGES["zlib-compress"] = STAGES["zlib-deflate"]
+
+
+def parse_recipe(recipe: str) -> List[Stage]:
+    """
+    Parses a recipe, i.e. comma separated steps named after the tools, each followed
+    by colon separated `option=value` pairs (e.g. `url-decode:plus,from-charcode:base=10`).
+    An option without a value is true. Values may use backslash escapes, so a delimiter
+    can be a comma (`\\x2c`) or a colon (`\\x3a`). Raises ValueError for bad recipes.
+    """
+    _stages: List[Stage] = []
+    for _step in recipe.split(","):
+        _name, *_options = _step.strip().split(":")
+        if _name not in STAGES:
+            raise ValueError(
+                f"Unknown step '{_name}', expected one of {', '.join(sorted(STAGES))}"
+            )
+        _builder, _parsers = STAGES[_name]
+
+        _kwargs: Dict[str, Any] = {}
+        for _option in _options:
+            _key, _, _value = _option.partition("=")
+            if _key not in _parsers:
+                raise ValueError(
+                    f"Unknown option '{_key}' for step '{_name}', expected one of "
+                    f"{', '.join(sorted(_parsers))}"
+                )
+            if "\\" in _value:
+                _value = codecs.decode(_value, "unicode_escape")
+            _argument, _parser = _parsers[_key]
+            try:
+                _kwargs[_argument] = _parser(_value)
+            except (ValueError, LookupError) as err:
+                raise ValueError(
+                    f"Invalid value '{_value}' for option '{_key}' of step '{_name}'"
+                ) from err
+
+        try:
+            _stages.append(_builder(**_kwargs))
+        except (typer.BadParameter, LookupError) as err:
+            raise ValueError(f"Invalid options for step '{_name}': {err}") from err
+    return _stages
+
+
+def run_recipe(stages: List[Stage], chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """
+    Chains the stages of a recipe into one generator. Each stage pulls chunks from the
+    one before it as it needs them, so only a few blocks are in memory at any time.
+    """
+    for _stage in stages:
+        chunks = _stage(chunks)
+    return chunks
+
+
+def validate_recipe(value: str):
+    try:
+        parse_recipe(value)
+    except ValueError as err:
+        raise typer.BadParameter(str(err))  # pylint: disable=raise-missing-from
+    return value
+
+
+@app.command()
+def thrunt_pipe(
+    recipe: str = typer.Argument(
+        ...,
+        callback=validate_recipe,
+        help="Comma separated steps, e.g. 'url-decode,from-charcode:base=10,zlib-inflate'",
+    ),
+    path_in: Path = typer.Option(
+        "-",
+        "--input",
+        "-i",
+        allow_dash=True,
+        readable=True,
+        file_okay=True,
+        dir_okay=False,
+        help="Filename for input stream",
+    ),
+    path_out: Path = typer.Option(
+        "-",
+        "--output",
+        "-o",
+        allow_dash=True,
+        writable=True,
+        file_okay=True,
+        dir_okay=False,
+        help="Filename for output stream",
+    ),
+    block_size: int = typer.Option(
+        DEFAULT_BLOCK_SIZE,
+        "--block-size",
+        "-b",
+        min=1,
+        help="Number of bytes read from the input at a time",
+    ),
+    version: Optional[bool] = typer.Option(  # pylint: disable=unused-argument
+        None, "--version", callback=version_callback, help="Show version info and exit"
+    ),
+):
+    """
+    Runs the input through a recipe of url-decode, url-encode, from-charcode,
+    to-charcode, zlib-inflate and zlib-deflate steps, in a single process. The
+    `encoding` option of from-charcode sets the encoding of its output (e.g. latin-1
+    turns character codes back into raw bytes), while from-charcode always reads UTF-8.
+    The `encoding` option of to-charcode sets the encoding its input is read in (e.g.
+    latin-1 gives the code of every raw byte).
+    """
+    _stages = parse_recipe(recipe)
+    with stream(path_in, "rb") as f_in, stream(path_out, "wb") as f_out:
+        _chunks = url_decode.block_generator(f_in, block_size)
+        try:
+            for _chunk in run_recipe(_stages, _chunks):
+                f_out.write(_chunk)
+        except zlib_inflate.InflateLimitError as err:
+            logger.error("%s, aborting", err)
+            raise typer.Exit(1)  # pylint: disable=raise-missing-from
+        except zlib.error as err:
+            logger.error("Unable to run recipe: %s", err)
+            raise typer.Exit(1)  # pylint: disable=raise-missing-from
+
+
+if __name__ == "__main__":
+    app()
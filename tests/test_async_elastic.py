@@ -0,0 +1,115 @@
+"""Unit tests for the asyncio query engine"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import asyncio
+import sys
+from unittest import mock
+
+import pytest
+
+from elastic.thrunting_tools.common.async_elastic import (
+    connect_async_elasticsearch,
+    limit_pages,
+    ordered,
+    search_after_pages,
+    write_pages,
+)
+from elastic.thrunting_tools.common.settings import ElasticsearchSettings
+
+
+async def _collect(pages):
+    return [_page async for _page in pages]
+
+
+def test_search_after_pages_prefetch():
+    """The next page is requested before the current page is consumed"""
+    esclient = mock.MagicMock()
+    esclient.open_point_in_time = mock.AsyncMock(return_value={"id": "pit-0"})
+    esclient.close_point_in_time = mock.AsyncMock()
+    requested = []
+
+    async def _search(**kwargs):
+        _start = 0 if kwargs["search_after"] is None else kwargs["search_after"][0] + 1
+        requested.append(_start)
+        _count = 2 if _start < 4 else 1
+        return {
+            "pit_id": f"pit-{_start}",
+            "hits": {"hits": [{"sort": [_start + _idx]} for _idx in range(_count)]},
+        }
+
+    esclient.search = _search
+
+    async def _consume():
+        _seen = []
+        async for _page in search_after_pages(
+            esclient, "logs-*", {"match_all": {}}, page_size=2
+        ):
+            await asyncio.sleep(0)
+            # the request for the following page has already gone out
+            _seen.append((_page[0]["sort"][0], list(requested)))
+        return _seen
+
+    seen = asyncio.run(_consume())
+
+    assert seen == [(0, [0, 2]), (2, [0, 2, 4]), (4, [0, 2, 4])]
+    esclient.close_point_in_time.assert_awaited_once_with(id="pit-4")
+
+
+def test_ordered_and_limit():
+    """Results keep factory order and are truncated to the requested size"""
+
+    async def _window(delay, hits):
+        await asyncio.sleep(delay)
+        return hits
+
+    factories = [
+        lambda: _window(0.02, [1, 2]),
+        lambda: _window(0.0, [3, 4]),
+        lambda: _window(0.01, [5, 6]),
+    ]
+
+    assert asyncio.run(_collect(ordered(factories, workers=2))) == [
+        [1, 2],
+        [3, 4],
+        [5, 6],
+    ]
+    assert asyncio.run(_collect(limit_pages(ordered(factories), 3))) == [[1, 2], [3]]
+
+
+def test_write_pages_stops():
+    """Writing stops as soon as the writer reports a closed output"""
+    written = []
+
+    def _write(page):
+        written.append(page)
+        return len(written) < 2
+
+    factories = [lambda _page=_page: asyncio.sleep(0, [_page]) for _page in range(5)]
+    asyncio.run(write_pages(ordered(factories), _write))
+
+    assert written == [[0], [1]]
+
+
+def test_connect_without_aiohttp():
+    """The async engine asks for the extra when aiohttp isn't installed"""
+    settings = ElasticsearchSettings(
+        name="no-aiohttp", hosts=["http://127.0.0.1:9200"], verify_connection=False
+    )
+
+    with mock.patch.dict(sys.modules, {"aiohttp": None}):
+        with pytest.raises(RuntimeError, match=r"thrunting-tools\[async\]"):
+            asyncio.run(connect_async_elasticsearch(settings))
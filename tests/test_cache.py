@@ -0,0 +1,96 @@
+"""Unit tests for the local result cache"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from elastic.thrunting_tools import eql_query, lucene_query
+from elastic.thrunting_tools.common.cache import ResultCache, cached_time_range
+
+
+def test_cached_time_range_is_stable():
+    """Relative ranges resolve identically within one TTL window"""
+    early = datetime(2022, 11, 16, 13, 0, 5, tzinfo=timezone.utc)
+    late = datetime(2022, 11, 16, 13, 14, 55, tzinfo=timezone.utc)
+    later = datetime(2022, 11, 16, 13, 15, 1, tzinfo=timezone.utc)
+
+    assert cached_time_range("now-30d/d", "now", 900, early) == (
+        "2022-10-17T00:00:00.000Z",
+        "2022-11-16T13:00:00.000Z",
+    )
+    assert cached_time_range("now-30d/d", "now", 900, late) == cached_time_range(
+        "now-30d/d", "now", 900, early
+    )
+    assert cached_time_range("now-30d/d", "now", 900, later)[1] == (
+        "2022-11-16T13:15:00.000Z"
+    )
+
+
+def test_result_cache_roundtrip(tmp_path: Path):
+    """Stored hits come back until the TTL expires"""
+    cache = ResultCache(tmp_path, ttl=60)
+    key = ResultCache.key(query="any where true", size=10)
+    hits = [{"_id": "1", "_source": {"host": {"name": "a"}}}]
+
+    assert cache.get(key) is None
+    cache.put(key, hits)
+    assert cache.get(key) == hits
+    assert ResultCache.key(size=10, query="any where true") == key
+
+    _entry = next(tmp_path.iterdir())
+    _stale = time.time() - 120
+    os.utime(_entry, (_stale, _stale))
+    assert cache.get(key) is None
+    assert not _entry.exists()
+
+
+def test_result_cache_lru_eviction(tmp_path: Path):
+    """The least recently read entries go first once over the size limit"""
+    cache = ResultCache(tmp_path, ttl=3600, max_bytes=10**9)
+    for _name in ("a", "b", "c"):
+        cache.put(_name, [{"_id": _name * 1000}])
+
+    _now = time.time()
+    for _age, _name in ((30, "a"), (20, "b"), (10, "c")):
+        _path = tmp_path / f"{_name}.json.gz"
+        os.utime(_path, (_now - _age, _now))
+    cache.get("a")  # most recently used now
+
+    cache.max_bytes = 2 * (tmp_path / "a.json.gz").stat().st_size
+    cache.evict()
+
+    assert sorted(_path.name for _path in tmp_path.iterdir()) == [
+        "a.json.gz",
+        "c.json.gz",
+    ]
+
+
+@pytest.mark.parametrize("app", [eql_query.app, lucene_query.app])
+def test_cached_time_range_invalid(tmp_path: Path, app):
+    """A time the cache can't resolve is a usage error, not a traceback"""
+    _result = CliRunner().invoke(
+        app,
+        ["x", "--cache", "--since", "2022-11", "--config", str(tmp_path / "none.yml")],
+    )
+
+    assert _result.exit_code == 2
+    assert "Invalid isoformat string" in _result.output
@@ -0,0 +1,184 @@
+"""Unit tests for zlib-deflate and zlib-inflate"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import gzip
+import os
+import zlib
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from elastic.thrunting_tools.compression import zlib_deflate, zlib_inflate
+
+DATA: bytes = bytes(100_000) + os.urandom(10_000) + b"thrunting" * 1000
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 4096, zlib_deflate.DEFAULT_BLOCK_SIZE])
+def test_round_trip(block_size: int):
+    """Any block size gives the same output as one-shot zlib"""
+    _compressed = b"".join(zlib_deflate.chunk_generator(BytesIO(DATA), block_size))
+    assert zlib.decompress(_compressed) == DATA
+
+    _chunks = list(zlib_inflate.chunk_generator(BytesIO(_compressed), block_size))
+    assert b"".join(_chunks) == DATA
+    assert max(map(len, _chunks)) <= block_size
+
+
+def test_adler32_combine():
+    """Checksums of adjacent pieces combine into the checksum of the whole"""
+    _first, _second = DATA[:12345], DATA[12345:]
+    assert zlib_deflate.adler32_combine(
+        zlib.adler32(_first), zlib.adler32(_second), len(_second)
+    ) == zlib.adler32(DATA)
+
+
+@pytest.mark.parametrize("block_size", [1000, 40_000, zlib_deflate.DEFAULT_BLOCK_SIZE])
+def test_parallel_deflate(block_size: int):
+    """Blocks compressed in parallel form one zlib stream, readable by zlib-inflate"""
+    _compressed = b"".join(
+        zlib_deflate.parallel_chunk_generator(BytesIO(DATA), block_size, threads=3)
+    )
+    assert zlib.decompress(_compressed) == DATA
+    assert b"".join(zlib_inflate.chunk_generator(BytesIO(_compressed))) == DATA
+
+
+def test_parallel_deflate_empty():
+    """No input still gives a valid zlib stream"""
+    _compressed = b"".join(zlib_deflate.parallel_chunk_generator(BytesIO(b"")))
+    assert zlib.decompress(_compressed) == b""
+
+
+def deflate_raw(data: bytes) -> bytes:
+    """Compresses data as raw deflate, without a header or checksum"""
+    _deflator = zlib.compressobj(wbits=-15)
+    return _deflator.compress(data) + _deflator.flush()
+
+
+@pytest.mark.parametrize("compress", [zlib.compress, gzip.compress, deflate_raw])
+def test_inflate_auto(compress):
+    """The format of the stream is picked from its header"""
+    _inflated = zlib_inflate.chunk_generator(
+        BytesIO(compress(DATA)), fmt=zlib_inflate.Format.AUTO
+    )
+    assert b"".join(_inflated) == DATA
+
+
+def test_scan_streams(tmp_path: Path):
+    """Every complete stream embedded in a blob is inflated, decoys are skipped"""
+    _zlib = zlib.compress(b"config" * 100)
+    _gzip = gzip.compress(DATA)
+    _blob = (
+        b"\xff" * 100
+        + b"\x78\x9cdecoy"
+        + _zlib
+        + b"\x00" * 10
+        + _gzip
+        + _zlib[:-10]  # truncated
+    )
+
+    _found = list(zlib_inflate.scan_streams(_blob, tmp_path))
+
+    assert [_item[:3] for _item in _found] == [
+        (_blob.index(_zlib), zlib_inflate.Format.ZLIB, len(_zlib)),
+        (_blob.index(_gzip), zlib_inflate.Format.GZIP, len(_gzip)),
+    ]
+    assert _found[0][3].read_bytes() == b"config" * 100
+    assert _found[1][3].read_bytes() == DATA
+    assert sorted(tmp_path.iterdir()) == sorted(_item[3] for _item in _found)
+
+
+def test_inflate_limits():
+    """Inflating stops once the output grows past a size or ratio limit"""
+    _bomb = zlib.compress(bytes(64 * 1024 * 1024), 9)
+    _chunks = zlib_inflate.chunk_generator(
+        BytesIO(_bomb), limit=zlib_inflate.OutputLimit(max_ratio=100)
+    )
+    with pytest.raises(zlib_inflate.InflateLimitError):
+        for _chunk in _chunks:
+            assert len(_chunk) <= zlib_inflate.DEFAULT_BLOCK_SIZE
+
+    _limit = zlib_inflate.OutputLimit(max_size=len(DATA) - 1)
+    with pytest.raises(zlib_inflate.InflateLimitError):
+        b"".join(
+            zlib_inflate.chunk_generator(
+                BytesIO(zlib.compress(DATA)), 1000, limit=_limit
+            )
+        )
+    assert _limit.size_out <= len(DATA) + 1000
+
+    _limit = zlib_inflate.OutputLimit(max_size=len(DATA), max_ratio=100)
+    _compressed = zlib.compress(DATA)
+    assert (
+        b"".join(zlib_inflate.chunk_generator(BytesIO(_compressed), limit=_limit))
+        == DATA
+    )
+
+
+def test_scan_streams_limits(tmp_path: Path):
+    """Streams over the limits are skipped while scanning"""
+    _bomb = zlib.compress(bytes(16 * 1024 * 1024), 9)
+    _zlib = zlib.compress(DATA)
+
+    _found = list(
+        zlib_inflate.scan_streams(_bomb + _zlib, tmp_path, 4096, max_ratio=100)
+    )
+
+    assert [_offset for _offset, *_ in _found] == [len(_bomb)]
+    assert _found[0][3].read_bytes() == DATA
+
+
+@pytest.mark.parametrize(
+    "level,strategy,wbits",
+    [
+        (1, zlib_deflate.Strategy.DEFAULT, 15),
+        (9, zlib_deflate.Strategy.FILTERED, -15),
+        (6, zlib_deflate.Strategy.RLE, 31),
+        (0, zlib_deflate.Strategy.HUFFMAN, 9),
+    ],
+)
+def test_deflate_options(level: int, strategy, wbits: int):
+    """Every combination of options inflates back to the input"""
+    _compressed = b"".join(
+        zlib_deflate.chunk_generator(BytesIO(DATA), 4096, level, strategy, wbits)
+    )
+    assert zlib.decompress(_compressed, wbits) == DATA
+
+    _inflated = zlib_inflate.chunk_generator(
+        BytesIO(_compressed), fmt=zlib_inflate.Format.AUTO
+    )
+    assert b"".join(_inflated) == DATA
+
+
+def test_deflate_zdict():
+    """A preset dictionary is needed to inflate the stream again"""
+    _zdict = b"thrunting" * 10
+    _compressed = b"".join(zlib_deflate.chunk_generator(BytesIO(DATA), zdict=_zdict))
+    with pytest.raises(zlib.error):
+        b"".join(zlib_inflate.chunk_generator(BytesIO(_compressed)))
+
+    _inflated = zlib_inflate.chunk_generator(BytesIO(_compressed), zdict=_zdict)
+    assert b"".join(_inflated) == DATA
+
+
+def test_benchmark_levels():
+    """Every level is benchmarked, and higher levels compress better"""
+    _results = list(zlib_deflate.benchmark_levels(DATA))
+
+    assert [_level for _level, _, _ in _results] == list(range(10))
+    assert all(_speed > 0 for _, _speed, _ in _results)
+    assert _results[0][2] < 1 < _results[9][2]
@@ -0,0 +1,65 @@
+"""Unit tests for client-side date math"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from datetime import datetime, timezone
+
+import pytest
+
+from elastic.thrunting_tools.common.datemath import resolve, split_range
+
+NOW = datetime(2022, 11, 16, 13, 45, 30, 123456, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "expression,expected",
+    [
+        ("now", NOW),
+        ("now-30d/d", datetime(2022, 10, 17, tzinfo=timezone.utc)),
+        ("now/M", datetime(2022, 11, 1, tzinfo=timezone.utc)),
+        ("now-1y+2h/h", datetime(2021, 11, 16, 15, tzinfo=timezone.utc)),
+        ("now/w", datetime(2022, 11, 14, tzinfo=timezone.utc)),
+        ("2022-01-31||+1M", datetime(2022, 2, 28, tzinfo=timezone.utc)),
+        ("2022-11-01T00:00:00Z", datetime(2022, 11, 1, tzinfo=timezone.utc)),
+        ("1668556800000", datetime(2022, 11, 16, tzinfo=timezone.utc)),
+    ],
+)
+def test_resolve(expression, expected):
+    """Date math resolves the way Elasticsearch would for gte/lt bounds"""
+    assert resolve(expression, NOW) == expected
+
+
+def test_resolve_invalid():
+    """Unknown units are rejected rather than silently ignored"""
+    with pytest.raises(ValueError):
+        resolve("now-3q", NOW)
+
+
+def test_split_range():
+    """Windows are contiguous, chronological and cover the whole range"""
+    windows = split_range("now-3d/d", "now/d", 3, NOW)
+
+    assert windows == [
+        ("2022-11-13T00:00:00.000Z", "2022-11-14T00:00:00.000Z"),
+        ("2022-11-14T00:00:00.000Z", "2022-11-15T00:00:00.000Z"),
+        ("2022-11-15T00:00:00.000Z", "2022-11-16T00:00:00.000Z"),
+    ]
+
+
+def test_split_range_empty():
+    """An inverted range cannot be split"""
+    with pytest.raises(ValueError):
+        split_range("now", "now-1d", 4, NOW)
@@ -0,0 +1,160 @@
+"""Unit tests for Elasticsearch helpers"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from unittest import mock
+
+from elastic.thrunting_tools.common.elastic import (
+    connect_elasticsearch,
+    fan_out,
+    msearch_hits,
+    search_after_hits,
+)
+from elastic.thrunting_tools.common.settings import ElasticsearchSettings
+
+
+@mock.patch("elasticsearch.Elasticsearch")
+def test_connect_elasticsearch_reuse(es_class):
+    """Clients are cached per settings, and the ping can be skipped"""
+    settings = ElasticsearchSettings(
+        name="reuse",
+        hosts=["http://127.0.0.1:9200"],
+        verify_connection=False,
+        http_compress=True,
+        request_timeout=120,
+    )
+
+    first = connect_elasticsearch(settings)
+    second = connect_elasticsearch(settings)
+
+    assert first is second
+    es_class.assert_called_once()
+    assert es_class.call_args.kwargs["http_compress"] is True
+    assert es_class.call_args.kwargs["request_timeout"] == 120
+    assert es_class.call_args.kwargs["max_retries"] == 10
+    first.ping.assert_not_called()
+
+
+def _page(start: int, count: int, pit_id: str) -> dict:
+    return {
+        "pit_id": pit_id,
+        "hits": {
+            "hits": [
+                {"_id": str(_idx), "sort": [_idx, _idx]}
+                for _idx in range(start, start + count)
+            ]
+        },
+    }
+
+
+def test_search_after_hits():
+    """Walks pages until a short page and always closes the latest PIT"""
+    esclient = mock.MagicMock()
+    esclient.open_point_in_time.return_value = {"id": "pit-0"}
+    esclient.search.side_effect = [
+        _page(0, 2, "pit-1"),
+        _page(2, 2, "pit-2"),
+        _page(4, 1, "pit-3"),
+    ]
+
+    hits = list(search_after_hits(esclient, "logs-*", {"match_all": {}}, page_size=2))
+
+    assert [hit["_id"] for hit in hits] == ["0", "1", "2", "3", "4"]
+    assert esclient.search.call_count == 3
+    assert esclient.search.call_args_list[0].kwargs["search_after"] is None
+    assert esclient.search.call_args_list[1].kwargs["search_after"] == [1, 1]
+    assert esclient.search.call_args_list[2].kwargs["pit"]["id"] == "pit-2"
+    esclient.close_point_in_time.assert_called_once_with(id="pit-3")
+
+
+def test_search_after_hits_closes_pit_early():
+    """Abandoning the generator still releases the PIT"""
+    esclient = mock.MagicMock()
+    esclient.open_point_in_time.return_value = {"id": "pit-0"}
+    esclient.search.return_value = _page(0, 2, "pit-0")
+
+    _gen = search_after_hits(esclient, "logs-*", {"match_all": {}}, page_size=2)
+    next(_gen)
+    _gen.close()
+
+    esclient.close_point_in_time.assert_called_once_with(id="pit-0")
+
+
+def test_search_after_hits_sliced():
+    """Sliced PIT pages are merged back into sort order"""
+    esclient = mock.MagicMock()
+    esclient.open_point_in_time.return_value = {"id": "pit-0"}
+
+    def _search(**kwargs):
+        _slice = kwargs["slice"]["id"]
+        _hits = [
+            {"_id": f"{_slice}-{_ts}", "sort": [_ts, _slice]}
+            for _ts in range(_slice, 6, 2)
+            if kwargs["search_after"] is None or _ts > kwargs["search_after"][0]
+        ][:2]
+        return {"pit_id": "pit-0", "hits": {"hits": _hits}}
+
+    esclient.search.side_effect = _search
+
+    hits = list(
+        search_after_hits(esclient, "logs-*", {"match_all": {}}, page_size=2, slices=2)
+    )
+
+    assert [hit["sort"][0] for hit in hits] == [0, 1, 2, 3, 4, 5]
+    esclient.close_point_in_time.assert_called_once_with(id="pit-0")
+
+
+def test_fan_out_keeps_window_order():
+    """Results come back in window order even when later windows finish first"""
+    windows = [("a", "b"), ("b", "c"), ("c", "d")]
+
+    def _search(since, before):
+        return [{"window": since}, {"window": before}]
+
+    assert [hit["window"] for hit in fan_out(_search, windows, workers=3)] == [
+        "a",
+        "b",
+        "b",
+        "c",
+        "c",
+        "d",
+    ]
+
+
+def test_msearch_hits():
+    """Bodies are batched into msearch requests and failures yield no hits"""
+    esclient = mock.MagicMock()
+
+    def _msearch(searches):
+        return {
+            "responses": [
+                {"error": {"reason": "parse failure"}}
+                if _body["query"] == "bad"
+                else {"hits": {"hits": [{"_id": _body["query"]}]}}
+                for _body in searches[1::2]
+            ]
+        }
+
+    esclient.msearch.side_effect = _msearch
+    bodies = [{"query": "a"}, {"query": "bad"}, {"query": "c"}]
+
+    results = list(msearch_hits(esclient, "logs-*", bodies, batch_size=2))
+
+    assert results == [[{"_id": "a"}], [], [{"_id": "c"}]]
+    assert esclient.msearch.call_count == 2
+    assert esclient.msearch.call_args_list[0].kwargs["searches"][0] == {
+        "index": "logs-*"
+    }
@@ -0,0 +1,128 @@
+"""Unit tests for eql-query"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from unittest import mock
+
+import elasticsearch
+import pytest
+from typer.testing import CliRunner
+
+from elastic.thrunting_tools import eql_query
+from elastic.thrunting_tools.common.datemath import isoformat
+
+START = datetime(2022, 11, 1, tzinfo=timezone.utc)
+EVENTS: List[str] = [isoformat(START + timedelta(minutes=_idx)) for _idx in range(100)]
+
+
+def _eql_search(**kwargs: Any) -> Dict[str, Any]:
+    """Fakes EQL search, which returns the first or last `size` events of the range"""
+    if kwargs["query"] == "bad":
+        raise elasticsearch.BadRequestError(
+            "parsing_exception", mock.Mock(status=400), {}
+        )
+    _range = kwargs["filter"]["range"]["@timestamp"]
+    _found = [
+        {"_source": {"@timestamp": _timestamp}}
+        for _timestamp in EVENTS
+        if _range["gte"] <= _timestamp < _range["lt"]
+    ]
+    if kwargs.get("result_position", "tail") == "tail":
+        _found = _found[max(len(_found) - kwargs["size"], 0) :]
+    else:
+        _found = _found[: kwargs["size"]]
+    return {"hits": {"total": {"value": len(_found)}, "events": _found}}
+
+
+def _run(
+    tmp_path, *args: str, query: str | None = "any where true"
+) -> List[Dict[str, Any]]:
+    _esclient = mock.MagicMock()
+    _esclient.eql.search.side_effect = _eql_search
+    _async_esclient = mock.MagicMock()
+    _async_esclient.eql.search = mock.AsyncMock(side_effect=_eql_search)
+    _async_esclient.close = mock.AsyncMock()
+
+    with mock.patch.object(
+        eql_query, "connect_elasticsearch", return_value=_esclient
+    ), mock.patch(
+        "elastic.thrunting_tools.common.async_elastic.connect_async_elasticsearch",
+        mock.AsyncMock(return_value=_async_esclient),
+    ):
+        _result = CliRunner().invoke(
+            eql_query.app,
+            [
+                *([query] if query is not None else []),
+                "--since",
+                EVENTS[0],
+                "--before",
+                "2022-11-01T02:00:00.000Z",
+                "--compact",
+                "--config",
+                str(tmp_path / "missing.yml"),
+                *args,
+            ],
+        )
+    assert _result.exit_code == 0, _result.output
+    return [json.loads(_line) for _line in _result.stdout.splitlines()]
+
+
+def _timestamps(docs: List[Dict[str, Any]]) -> List[str]:
+    return [_doc["_source"]["@timestamp"] for _doc in docs]
+
+
+@pytest.mark.parametrize("size", ["1", "30", "100", "500"])
+@pytest.mark.parametrize("engine", [[], ["--async"]])
+def test_slices_same_events(tmp_path, size: str, engine: List[str]):
+    """Slicing the time range doesn't change which events are returned"""
+    _unsliced = _timestamps(_run(tmp_path, "--size", size, *engine))
+
+    assert _unsliced == EVENTS[-int(size) :]
+    assert (
+        _timestamps(_run(tmp_path, "--size", size, "--slices", "7", *engine))
+        == _unsliced
+    )
+
+
+def test_slices_cache_key(tmp_path):
+    """Sliced and unsliced runs don't share a cache entry"""
+    _keys = []
+
+    def _get(_cache, key):
+        _keys.append(key)
+        return [{"_source": {"@timestamp": EVENTS[0]}}]
+
+    with mock.patch.object(eql_query.ResultCache, "get", _get):
+        _run(tmp_path, "--cache")
+        _run(tmp_path, "--cache", "--slices", "2")
+
+    assert len(set(_keys)) == 2
+
+
+@pytest.mark.parametrize("engine", [[], ["--async"]])
+def test_queries_failed_search(tmp_path, engine: List[str]):
+    """A query that fails is skipped, the rest of the batch still runs"""
+    _queries = tmp_path / "queries.txt"
+    _queries.write_text("good\nbad\ngood2\n")
+
+    _docs = _run(
+        tmp_path, "--queries", str(_queries), "--size", "2", *engine, query=None
+    )
+
+    assert [_doc["_query"] for _doc in _docs] == ["good", "good", "good2", "good2"]
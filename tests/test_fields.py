@@ -0,0 +1,79 @@
+"""Unit tests for field projection"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from elastic.thrunting_tools.common.fields import (
+    MISSING,
+    compile_accessor,
+    compile_fields,
+    response_filter,
+    source_filter,
+)
+
+HIT = {
+    "_id": "1",
+    "_source": {
+        "process": {"name": "cmd.exe", "parent": {"name": "EXCEL.EXE"}, "pid": 0},
+        "host.name": "workstation",
+        "dns": {"question.name": "example.duckdns.org"},
+        "event": {"kind": None},
+    },
+}
+
+
+def test_compile_accessor():
+    """Nested, flattened and partially flattened keys all resolve"""
+    assert compile_accessor("process.parent.name")(HIT["_source"]) == "EXCEL.EXE"
+    assert compile_accessor("host.name")(HIT["_source"]) == "workstation"
+    assert compile_accessor("dns.question.name")(HIT["_source"]) == (
+        "example.duckdns.org"
+    )
+    assert compile_accessor("process.missing")(HIT["_source"]) is MISSING
+    assert compile_accessor("process.name.length")(HIT["_source"]) is MISSING
+
+
+def test_compile_fields():
+    """Projected views are nested and skip missing or null fields"""
+    projection = compile_fields(
+        ["process.name", "process.pid", "host.name", "event.kind", "user.name"]
+    )
+
+    assert projection(HIT) == {
+        "process": {"name": "cmd.exe", "pid": 0},
+        "host": {"name": "workstation"},
+    }
+    assert projection({"_id": "2"}) == {}
+
+
+def test_source_filter():
+    """Includes and excludes map onto the search API _source parameter"""
+    assert source_filter([], []) == {}
+    assert source_filter(["process.name"], ["process.env"]) == {
+        "source": {"includes": ["process.name"], "excludes": ["process.env"]}
+    }
+
+
+def test_response_filter():
+    """EQL responses are trimmed with filter_path instead"""
+    assert response_filter("hits.events", None) == {}
+    assert response_filter("hits.events", ["host.name"], ["host.ip"]) == {
+        "filter_path": [
+            "hits.total",
+            "hits.events._id",
+            "hits.events._source.host.name",
+            "-hits.events._source.host.ip",
+        ]
+    }
@@ -0,0 +1,175 @@
+"""Unit tests for the format tools"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import urllib.parse
+from itertools import combinations
+from io import BytesIO, StringIO
+
+import pytest
+
+from elastic.thrunting_tools.format import (
+    from_charcode,
+    to_charcode,
+    url_decode,
+    url_encode,
+)
+
+TEXT: str = "IEX (New-Object Net.WebClient)\x00\n\tħéllø 🦌" * 50
+
+
+@pytest.mark.parametrize("base,delimiter", [(16, " "), (10, ","), (2, ""), (36, ", ")])
+def test_to_charcode(base: int, delimiter: str):
+    """Blocks are converted to the same codes as converting one character at a time"""
+    _blocks = to_charcode.chunk_generator(StringIO(TEXT), 7)
+    _encoded = b"".join(to_charcode.encode_blocks(_blocks, base, delimiter))
+
+    assert _encoded.decode() == delimiter.join(
+        to_charcode.int2base(ord(_chr), base) for _chr in TEXT
+    )
+
+
+def test_int2base():
+    """Codes don't lose any digits, including zero"""
+    assert to_charcode.int2base(0, 16) == "0"
+    assert to_charcode.int2base(255, 16) == "ff"
+    assert to_charcode.int2base(65, 2) == "1000001"
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 5, 4096])
+@pytest.mark.parametrize("base,delimiter", [(16, " "), (10, ", "), (2, "<->")])
+def test_from_charcode(block_size: int, base: int, delimiter: str):
+    """Tokens and delimiters split across blocks are decoded as if read in one go"""
+    _codes = delimiter.join(to_charcode.int2base(ord(_chr), base) for _chr in TEXT)
+    _blocks = from_charcode.chunk_generator(StringIO(_codes + "\n"), block_size)
+
+    assert "".join(from_charcode.decode_blocks(_blocks, delimiter, base)) == TEXT
+
+
+def test_from_charcode_invalid():
+    """Tokens that aren't a code are skipped, however long they are"""
+    _codes = "48 zz 49 " + "4" * 10_000 + " 110000 4a"
+    _blocks = from_charcode.chunk_generator(StringIO(_codes), 100)
+
+    assert "".join(from_charcode.decode_blocks(_blocks, " ", 16)) == "HIJ"
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 4096])
+def test_from_charcode_auto(block_size: int):
+    """Every dialect is decoded in one pass, wherever the input is split into blocks"""
+    _codes = (
+        "x = String.fromCharCode(72, 0x69); [char]0x41+[CHAR]66 \\x43\\u0044\\u{1F98C} "
+        "&#69;&#x46; %u0047 \\ud83e\\udd8c \\xZZ String.fromCharCode(1e9999) "
+        + "String.fromCharCode("
+        + ",".join(["74"] * 100)
+        + ")"
+    )
+    _blocks = from_charcode.chunk_generator(StringIO(_codes), block_size)
+
+    assert "".join(from_charcode.decode_dialects(_blocks)) == (
+        "x = Hi; A+B CD\U0001F98C EF G \U0001F98C \\xZZ String.fromCharCode(1e9999) "
+        + "J" * 100
+    )
+
+
+@pytest.mark.parametrize("block_size", [1, 8, 31, 4096])
+def test_from_charcode_auto_longest(block_size: int):
+    """The longest matches decode the same whatever the block size"""
+    _codes = (
+        "x" * 40
+        + "[char]"
+        + " " * 8
+        + "0x10ffff;[char]"
+        + " " * 9
+        + "65;&#x10ffff;&#1114111;\\u{10ffff}"
+    )
+    _blocks = from_charcode.chunk_generator(StringIO(_codes), block_size)
+
+    assert "".join(from_charcode.decode_dialects(_blocks)) == (
+        "x" * 40 + "\U0010ffff;[char]" + " " * 9 + "65;\U0010ffff\U0010ffff\U0010ffff"
+    )
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 4096])
+def test_url_decode(block_size: int):
+    """Escapes and UTF-8 sequences split across blocks are decoded as if read in one go"""
+    _encoded = (urllib.parse.quote(TEXT) + " a+b %zz 50%% \\x41 %2").encode("ascii")
+    _blocks = url_decode.block_generator(BytesIO(_encoded), block_size)
+
+    assert b"".join(url_decode.decode_blocks(_blocks)) == (
+        urllib.parse.unquote_to_bytes(_encoded)
+    )
+
+
+def test_url_decode_plus():
+    """Form data decodes '+' as a space, but not an escaped '+'"""
+    _blocks = url_decode.block_generator(BytesIO(b"a+b%2Bc"))
+
+    assert b"".join(url_decode.decode_blocks(_blocks, plus=True)) == b"a b+c"
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 4096])
+def test_url_decode_recursive(block_size: int):
+    """Payloads encoded several times are decoded until nothing changes"""
+    _encoded = b"id=%2527%252520OR%2525201%25253D1 %2541 100%25"
+    _blocks = url_decode.block_generator(BytesIO(_encoded), block_size)
+
+    assert b"".join(url_decode.decode_blocks(_blocks, recursive=True)) == (
+        b"id=' OR 1=1 A 100%"
+    )
+
+
+@pytest.mark.parametrize(
+    "encoded", [b"%8%31", b"%258%2531", b"a%2525%32%35%34%31b%", b"%%2541%25%34"]
+)
+def test_url_decode_recursive_splits(encoded: bytes):
+    """Recursive decoding gives the same result however the input is split"""
+    _expected = encoded
+    while (_decoded := urllib.parse.unquote_to_bytes(_expected)) != _expected:
+        _expected = _decoded
+
+    for _count in (1, 2):
+        for _cuts in combinations(range(1, len(encoded)), _count):
+            _bounds = (0, *_cuts, len(encoded))
+            _blocks = [
+                encoded[_start:_end] for _start, _end in zip(_bounds, _bounds[1:])
+            ]
+            assert (
+                b"".join(url_decode.decode_blocks(iter(_blocks), recursive=True))
+                == _expected
+            ), _blocks
+
+
+@pytest.mark.parametrize("block_size", [1, 100, 4096])
+@pytest.mark.parametrize("safe", ["", "/", "/ %"])
+def test_url_encode(block_size: int, safe: str):
+    """Every byte value is encoded like urllib.parse.quote_from_bytes does"""
+    _data = bytes(range(256)) + TEXT.encode("utf-8")
+    _blocks = url_encode.block_generator(BytesIO(_data), block_size)
+    _safe = url_encode.UNRESERVED + safe.encode("ascii")
+
+    assert b"".join(url_encode.quote_blocks(_blocks, _safe)) == (
+        urllib.parse.quote_from_bytes(_data, safe=safe).encode("ascii")
+    )
+
+
+def test_url_encode_all():
+    """Only letters and digits are left as they are with --all, NUL is never safe"""
+    _blocks = url_encode.block_generator(BytesIO(b"a-Z_9.~/ \0"))
+
+    assert b"".join(url_encode.quote_blocks(_blocks, b"\0")) == (
+        b"a%2DZ%5F9%2E%7E%2F%20%00"
+    )
@@ -0,0 +1,94 @@
+"""Unit tests for lucene-query"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from unittest import mock
+
+import pytest
+from typer.testing import CliRunner
+
+from elastic.thrunting_tools import lucene_query
+from elastic.thrunting_tools.common.datemath import isoformat
+
+START = datetime(2022, 11, 1, tzinfo=timezone.utc)
+HITS: List[str] = [isoformat(START + timedelta(minutes=_idx)) for _idx in range(100)]
+
+
+def _search(**kwargs: Any) -> Dict[str, Any]:
+    """Fakes search, returning `size` hits sorted as asked, or in a relevance order"""
+    _range = kwargs["query"]["bool"]["filter"][0]["range"]["@timestamp"]
+    _found = [
+        {"_source": {"@timestamp": _timestamp}}
+        for _timestamp in HITS
+        if _range["gte"] <= _timestamp < _range["lt"]
+    ]
+    _sort = kwargs.get("sort")
+    if _sort:
+        _found.sort(
+            key=lambda _hit: _hit["_source"]["@timestamp"],
+            reverse=_sort[0]["@timestamp"]["order"] == "desc",
+        )
+    else:
+        random.Random(0).shuffle(_found)
+    return {"hits": {"total": {"value": len(_found)}, "hits": _found[: kwargs["size"]]}}
+
+
+def _run(tmp_path, *args: str) -> List[str]:
+    _esclient = mock.MagicMock()
+    _esclient.search.side_effect = _search
+    _async_esclient = mock.MagicMock()
+    _async_esclient.search = mock.AsyncMock(side_effect=_search)
+    _async_esclient.close = mock.AsyncMock()
+
+    with mock.patch.object(
+        lucene_query, "connect_elasticsearch", return_value=_esclient
+    ), mock.patch(
+        "elastic.thrunting_tools.common.async_elastic.connect_async_elasticsearch",
+        mock.AsyncMock(return_value=_async_esclient),
+    ):
+        _result = CliRunner().invoke(
+            lucene_query.app,
+            [
+                "*",
+                "--since",
+                HITS[0],
+                "--before",
+                "2022-11-01T02:00:00.000Z",
+                "--compact",
+                "--config",
+                str(tmp_path / "missing.yml"),
+                *args,
+            ],
+        )
+    assert _result.exit_code == 0, _result.output
+    return [
+        json.loads(_line)["_source"]["@timestamp"]
+        for _line in _result.stdout.splitlines()
+    ]
+
+
+@pytest.mark.parametrize("size", ["1", "30", "100", "500"])
+@pytest.mark.parametrize("engine", [[], ["--async"]])
+def test_slices_same_hits(tmp_path, size: str, engine: List[str]):
+    """Slicing the time range doesn't change which hits are returned"""
+    _unsliced = _run(tmp_path, "--size", size, *engine)
+
+    assert _unsliced == HITS[-int(size) :]
+    assert _run(tmp_path, "--size", size, "--slices", "7", *engine) == _unsliced
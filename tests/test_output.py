@@ -0,0 +1,45 @@
+"""Unit tests for result serialization"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import io
+import json
+
+from elastic.thrunting_tools.common.output import dumps, write_ndjson
+
+
+def test_dumps():
+    """Output is compact, key-sorted UTF-8 JSON"""
+    assert dumps({"b": 1, "a": {"d": "é", "c": [1, 2]}}) == (
+        '{"a":{"c":[1,2],"d":"é"},"b":1}'.encode("utf-8")
+    )
+
+
+def test_dumps_wide_integers():
+    """Integers beyond 64 bits fall back to the standard library encoder"""
+    assert json.loads(dumps({"hash": 2**70})) == {"hash": 2**70}
+
+
+def test_write_ndjson():
+    """Every document ends up on its own line, across batch boundaries"""
+    f_out = io.BytesIO()
+    docs = [{"_id": str(_idx)} for _idx in range(600)]
+
+    assert write_ndjson(docs, f_out) == 600
+
+    lines = f_out.getvalue().split(b"\n")
+    assert lines[-1] == b""
+    assert [json.loads(_line) for _line in lines[:-1]] == docs
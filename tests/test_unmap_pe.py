@@ -0,0 +1,220 @@
+"""Unit tests for unmap-pe"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+import struct
+from hashlib import sha256
+from io import BytesIO
+from pathlib import Path
+from typing import List, Tuple
+
+import pefile
+
+from elastic.thrunting_tools.binaries.unmap_pe import (
+    batch_paths,
+    carve_images,
+    find_images,
+    read_headers,
+    stream_unmapped,
+    unmap_batch,
+    unmap_pefile,
+    write_unmapped,
+)
+
+SECTION_ALIGNMENT: int = 0x1000
+FILE_ALIGNMENT: int = 0x200
+
+
+def mapped_image(sections: List[bytes]) -> Tuple[bytes, bytes]:
+    """
+    Builds a minimal PE32 image laid out as it would be in memory, along with the file
+    it was loaded from. Each section is FILE_ALIGNMENT bytes of raw data.
+    """
+    _headers = bytearray(FILE_ALIGNMENT)
+    _headers[:2] = b"MZ"
+    struct.pack_into("<I", _headers, 0x3C, 0x40)
+    _headers[0x40:0x44] = b"PE\0\0"
+    struct.pack_into(
+        "<HHIIIHH", _headers, 0x44, 0x14C, len(sections), 0, 0, 0, 0xE0, 0x102
+    )
+    struct.pack_into(
+        "<HBBIIIIIIIIIHHHHHHIIIIHHIIIIII",
+        _headers,
+        0x58,
+        0x10B,  # PE32
+        *(0,) * 9,
+        SECTION_ALIGNMENT,
+        FILE_ALIGNMENT,
+        *(0,) * 7,
+        SECTION_ALIGNMENT * (len(sections) + 1),
+        FILE_ALIGNMENT,
+        *(0,) * 8,
+        16,
+    )
+
+    _mapped = bytearray(SECTION_ALIGNMENT * (len(sections) + 1))
+    _mapped[:FILE_ALIGNMENT] = _headers
+    _file = bytearray(_headers)
+    for _idx, _data in enumerate(sections):
+        _address = SECTION_ALIGNMENT * (_idx + 1)
+        struct.pack_into(
+            "<8sIIIIIIHHI",
+            _mapped,
+            0x138 + 40 * _idx,
+            f".s{_idx}".encode(),
+            FILE_ALIGNMENT,
+            _address,
+            FILE_ALIGNMENT,
+            FILE_ALIGNMENT * (_idx + 1),
+            0,
+            0,
+            0,
+            0,
+            0x40000040,
+        )
+        _mapped[_address : _address + len(_data)] = _data
+    _file[:FILE_ALIGNMENT] = _mapped[:FILE_ALIGNMENT]
+    for _data in sections:
+        _file += _data.ljust(FILE_ALIGNMENT, b"\0")
+
+    return bytes(_mapped), bytes(_file)
+
+
+def test_write_unmapped():
+    """Sections are copied from their virtual address to their raw offset"""
+    _mapped, _file = mapped_image([b"\x90" * 0x100, b"data"])
+    _pe = pefile.PE(data=_mapped, fast_load=True)
+    _out = BytesIO()
+
+    write_unmapped(_pe, _mapped, _out)
+
+    assert _out.getvalue() == _file
+
+
+def test_unmap_pefile(tmp_path: Path):
+    """Unmaps a PE file into the output file"""
+    _mapped, _file = mapped_image([b"code", b"data", b"rsrc"])
+    _path_in = tmp_path / "module.dmp"
+    _path_in.write_bytes(_mapped)
+    _path_out = tmp_path / "module.bin"
+
+    unmap_pefile(
+        path_in=_path_in, path_out=_path_out, batch=None, carve=None, streaming=False
+    )
+
+    assert _path_out.read_bytes() == _file
+
+
+def test_unmap_batch(tmp_path: Path, capsys):
+    """Every PE file in a directory is unmapped alongside itself"""
+    _mapped, _file = mapped_image([b"code"])
+    (tmp_path / "a.dmp").write_bytes(_mapped)
+    (tmp_path / "b.dmp").write_bytes(b"not a PE")
+    (tmp_path / "c.dmp").write_bytes(_mapped)
+    (tmp_path / "c.dmp.unmapped").write_bytes(b"from an earlier run")
+
+    _paths = batch_paths(tmp_path)
+    assert [_path.name for _path in _paths] == ["a.dmp", "b.dmp", "c.dmp"]
+    assert not unmap_batch(_paths, workers=2)
+
+    assert (tmp_path / "a.dmp.unmapped").read_bytes() == _file
+    assert (tmp_path / "c.dmp.unmapped").read_bytes() == _file
+    assert not (tmp_path / "b.dmp.unmapped").exists()
+
+    _shasum = sha256(_mapped).hexdigest()
+    assert capsys.readouterr().out.splitlines() == [
+        f"{_shasum}\t{tmp_path / 'a.dmp'}\t{tmp_path / 'a.dmp.unmapped'}",
+        f"{_shasum}\t{tmp_path / 'c.dmp'}\t{tmp_path / 'c.dmp.unmapped'}",
+    ]
+
+
+def test_batch_paths_list(tmp_path: Path):
+    """A file lists the paths to unmap, one per line"""
+    _list = tmp_path / "modules.txt"
+    _list.write_text("/dumps/a.dll\n\n/dumps/b.exe \n/dumps/b.exe.unmapped\n")
+
+    assert batch_paths(_list) == [Path("/dumps/a.dll"), Path("/dumps/b.exe")]
+
+
+def test_find_images():
+    """Only MZ headers pointing at a PE signature are candidates"""
+    _mapped, _ = mapped_image([b"code"])
+    _dump = b"MZ" + bytes(0x3E) + b"MZ\x90" + bytes(0x1000) + _mapped + b"MZ"
+
+    assert list(find_images(_dump)) == [0x1043]
+
+
+def test_carve_images(tmp_path: Path):
+    """Every image in a dump is unmapped to a file named after its offset"""
+    _first, _first_file = mapped_image([b"code"])
+    _second, _second_file = mapped_image([b"code", b"data"])
+    _dump = bytes(0x1000) + _first + b"MZ" * 0x800 + _second + bytes(0x10)
+
+    _carved = list(carve_images(_dump, tmp_path / "carved"))
+
+    assert [(_offset, _shasum) for _offset, _shasum, _ in _carved] == [
+        (0x1000, sha256(_first_file).hexdigest()),
+        (0x4000, sha256(_second_file).hexdigest()),
+    ]
+    assert _carved[0][2] == tmp_path / "carved" / "0x1000.unmapped"
+    assert _carved[0][2].read_bytes() == _first_file
+    assert _carved[1][2].read_bytes() == _second_file
+
+
+class TrickleReader(BytesIO):
+    """Hands out at most `size` bytes per read, like a pipe"""
+
+    def __init__(self, data: bytes, size: int):
+        super().__init__(data)
+        self.size = size
+
+    def read1(self, size: int = -1) -> bytes:
+        return super().read1(min(size, self.size))
+
+
+def test_stream_unmapped():
+    """Sections are written in table order while the image is read"""
+    _mapped, _file = mapped_image([b"code", b"data", b"rsrc"])
+    _f_in = TrickleReader(_mapped, 0x300)
+
+    _headers = read_headers(_f_in)
+    assert len(_headers) == FILE_ALIGNMENT
+    _out = BytesIO()
+    stream_unmapped(
+        pefile.PE(data=bytes(_headers), fast_load=True), _headers, _f_in, _out
+    )
+
+    assert _out.getvalue() == _file
+
+
+def test_stream_unmapped_out_of_order():
+    """Parts of later sections that are read early are held back"""
+    _mapped, _ = mapped_image([b"code", b"data", b"rsrc"])
+    _image = bytearray(_mapped)
+    # The raw data of the first section runs into the virtual range of the second
+    struct.pack_into("<I", _image, 0x138 + 16, 0x1800)
+    _image[0x2000:0x2004] = b"DATA"
+    _f_in = TrickleReader(bytes(_image), 0x300)
+
+    _headers = read_headers(_f_in)
+    _pe = pefile.PE(data=bytes(_headers), fast_load=True)
+    _out = BytesIO()
+    stream_unmapped(_pe, _headers, _f_in, _out)
+
+    _expected = BytesIO()
+    write_unmapped(_pe, _image, _expected)
+    assert _out.getvalue() == _expected.getvalue()
+    assert _out.getvalue().count(b"DATA") == 2
@@ -0,0 +1,61 @@
+"""Unit tests for shared utilities"""
+# Licensed to Elasticsearch B.V. under one or more contributor
+# license agreements. See the NOTICE file distributed with
+# this work for additional information regarding copyright
+# ownership. Elasticsearch B.V. licenses this file to you under
+# the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# 	http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+from pathlib import Path
+
+from elastic.thrunting_tools.common.utils import map_input, read_queries
+
+
+def test_read_queries_lines(tmp_path: Path):
+    """Plain files hold one query per line, ignoring blanks and comments"""
+    queries = tmp_path / "iocs.txt"
+    queries.write_text(
+        "dns.question.name: evil.example\n\n# comment\n  host.ip: 10.0.0.1 \n"
+    )
+
+    assert read_queries(queries) == [
+        "dns.question.name: evil.example",
+        "host.ip: 10.0.0.1",
+    ]
+
+
+def test_read_queries_yaml(tmp_path: Path):
+    """YAML files hold a list of queries or of mappings with a query key"""
+    queries = tmp_path / "hunt.yml"
+    queries.write_text(
+        "- 'process where process.name == \"cmd.exe\"'\n"
+        "- query: 'network where destination.port == 4444'\n"
+        "  note: ignored\n"
+    )
+
+    assert read_queries(queries) == [
+        'process where process.name == "cmd.exe"',
+        "network where destination.port == 4444",
+    ]
+
+
+def test_map_input(tmp_path: Path):
+    """Files are memory mapped, empty ones are read instead"""
+    _path = tmp_path / "dump.bin"
+    _path.write_bytes(b"MZ")
+    with _path.open("rb") as f_in, map_input(f_in) as _data:
+        assert not isinstance(_data, bytes)
+        assert _data[:] == b"MZ"
+
+    _path.write_bytes(b"")
+    with _path.open("rb") as f_in, map_input(f_in) as _data:
+        assert _data == b""